@@ -0,0 +1,409 @@
+"""
+Standalone JSON API for the student marking flow.
+
+A plain ASGI application over attendance_core.AttendanceService, so a
+phone marks attendance with one small HTTP request instead of a full
+Streamlit websocket session and script rerun. It shares attendance.db
+(and its schema migrations) with the Streamlit page.
+
+    python attendance_api.py --port 8000          # needs uvicorn
+    uvicorn attendance_api:app --port 8000
+
+Routes:
+
+    GET  /               minimal marking page (the QR can point here)
+    GET  /api/session    the active session, its countdown and counter
+    POST /api/validate   {"pass_key"}
+    POST /api/mark       {"roll", "pass_key"} plus, for first-time
+                         students, {"name", "student_class", "gmail",
+                         "mobile"}
+
+With QR_SIGNING_SECRET set (signed-QR mode) clients send {"qr": {...}},
+the query parameters of the scanned URL, instead of "pass_key"; the
+signature is checked in memory and the pass key is no longer accepted.
+
+Email settings come from the EMAIL_ADDRESS, EMAIL_PASSWORD, SMTP_HOST,
+SMTP_PORT and SMTP_USE_SSL environment variables.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from attendance_core import (
+    DB_PATH,
+    STUDENT_CLASSES,
+    WRITE_RESULT_TIMEOUT_SECONDS,
+    AttendanceService,
+    EmailSettings,
+    Student,
+    email_settings_from,
+    now_ist,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 8192
+REGISTRATION_FIELDS = ("name", "student_class", "gmail", "mobile")
+
+# ============================================================
+# SETTINGS
+# ============================================================
+
+def email_settings_from_env() -> EmailSettings:
+    return email_settings_from(os.environ)
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status: int, error: str, **extra):
+        super().__init__(error)
+        self.status = status
+        self.payload = {"error": error, **extra}
+
+
+# ============================================================
+# ASGI APPLICATION
+# ============================================================
+
+class AttendanceAPI:
+    """ASGI callable; the service is created on first use, once per process."""
+
+    def __init__(self, db_path: str = DB_PATH,
+                 email_settings: Optional[EmailSettings] = None,
+                 qr_secret: Optional[str] = None):
+        self.db_path = db_path
+        self.email_settings = email_settings
+        self.qr_secret = qr_secret or os.environ.get("QR_SIGNING_SECRET")
+        self._service: Optional[AttendanceService] = None
+        self._lock = threading.Lock()
+
+        self.routes = {
+            ("GET", "/"): self.page,
+            ("GET", "/api/session"): self.get_session,
+            ("POST", "/api/validate"): self.validate,
+            ("POST", "/api/mark"): self.mark,
+        }
+
+    @property
+    def service(self) -> AttendanceService:
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._service = AttendanceService(
+                        self.db_path,
+                        self.email_settings or email_settings_from_env(),
+                        self.qr_secret
+                    )
+        return self._service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        handler = self.routes.get((scope["method"], scope["path"]))
+
+        try:
+            if handler is None:
+                if any(path == scope["path"] for _, path in self.routes):
+                    raise HTTPError(405, "method_not_allowed")
+                raise HTTPError(404, "not_found")
+
+            body = await self._read_body(receive) if scope["method"] == "POST" else b""
+            response = await handler(body)
+        except HTTPError as exc:
+            response = (exc.status, exc.payload)
+        except sqlite3.Error:
+            logger.exception("Database error on %s", scope["path"])
+            response = (503, {"error": "database_unavailable"})
+
+        await self._send(send, *response)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Migrate and start the writer before the first student arrives
+                self.service
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY_BYTES:
+                raise HTTPError(413, "body_too_large")
+            if not message.get("more_body"):
+                return body
+
+    @staticmethod
+    async def _send(send, status: int, payload) -> None:
+        if isinstance(payload, str):
+            content_type = b"text/html; charset=utf-8"
+            body = payload.encode()
+        else:
+            content_type = b"application/json"
+            body = json.dumps(payload).encode()
+
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(body)).encode()),
+                (b"cache-control", b"no-store"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    def _json(body: bytes) -> dict:
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "invalid_json")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "invalid_json")
+        return payload
+
+    @staticmethod
+    def _text(payload: dict, field: str) -> str:
+        """A string field, stripped; null or any non-string counts as missing."""
+        value = payload.get(field)
+        return value.strip() if isinstance(value, str) else ""
+
+    # ---------------- HANDLERS ----------------
+
+    async def page(self, body: bytes):
+        return 200, MARK_PAGE
+
+    async def get_session(self, body: bytes):
+        session = self.service.active_session()
+        if not session:
+            return 200, {"active": False}
+
+        return 200, {
+            "active": True,
+            "subject": session.subject,
+            "expires_in": session.remaining_seconds(),
+            "capacity": session.capacity,
+            "marked": self.service.marked_count(session.token),
+        }
+
+    def _session_for(self, payload: dict):
+        if self.service.qr_tokens:
+            qr = payload.get("qr")
+            session = self.service.verify_qr(qr) if isinstance(qr, dict) else None
+            if not session:
+                raise HTTPError(403, "invalid_qr")
+            return session
+
+        if not self.service.active_session():
+            raise HTTPError(404, "no_active_session")
+
+        session = self.service.validate_pass_key(self._text(payload, "pass_key"))
+        if not session:
+            raise HTTPError(403, "invalid_pass_key")
+
+        # Expiry checked at the moment of the request, as on the Streamlit page
+        if now_ist() > session.expiry:
+            raise HTTPError(410, "session_expired")
+        return session
+
+    async def validate(self, body: bytes):
+        session = self._session_for(self._json(body))
+        return 200, {
+            "valid": True,
+            "subject": session.subject,
+            "expires_in": session.remaining_seconds(),
+        }
+
+    async def mark(self, body: bytes):
+        payload = self._json(body)
+
+        roll = self._text(payload, "roll").upper()
+        if not roll:
+            raise HTTPError(400, "roll_required")
+
+        session = self._session_for(payload)
+        service = self.service
+
+        registration = None
+        student = service.find_student(roll, session.subject)
+
+        if student is None:
+            fields = {
+                field: self._text(payload, field)
+                for field in REGISTRATION_FIELDS
+            }
+            missing = [field for field, value in fields.items() if not value]
+            if missing:
+                raise HTTPError(422, "registration_required", fields=missing)
+            if fields["student_class"] not in STUDENT_CLASSES:
+                raise HTTPError(422, "invalid_student_class", choices=list(STUDENT_CLASSES))
+
+            registration = student = Student(
+                roll,
+                fields["name"],
+                fields["student_class"],
+                fields["gmail"],
+                fields["mobile"],
+                session.subject
+            )
+
+        future = service.submit_mark_attendance(
+            roll, student.name, session.subject, session.token,
+            student.gmail, registration
+        )
+        try:
+            result = await asyncio.wait_for(
+                asyncio.wrap_future(future), WRITE_RESULT_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            raise HTTPError(503, "write_timeout")
+
+        return 200, {
+            "result": result,
+            "subject": session.subject,
+            "marked": service.marked_count(session.token),
+            "capacity": session.capacity,
+        }
+
+
+app = AttendanceAPI()
+
+# ============================================================
+# MARKING PAGE
+# ============================================================
+
+MARK_PAGE = """<!doctype html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Mark Attendance</title>
+<style>
+body { font-family: sans-serif; max-width: 420px; margin: 2em auto; padding: 0 1em; }
+h2 { color: rgba(0, 123, 255, 0.9); text-align: center; }
+label, input, select, button { display: block; width: 100%; box-sizing: border-box; }
+input, select { margin: .25em 0 1em; padding: .6em; font-size: 1em; }
+button { padding: .8em; font-size: 1em; background: #007bff; color: #fff; border: 0; border-radius: 6px; }
+#session { text-align: center; font-size: 1.2em; margin-bottom: 1em; }
+#message { margin-top: 1em; padding: .8em; border-radius: 6px; display: none; }
+.ok { background: #d4edda; } .warn { background: #fff3cd; } .err { background: #f8d7da; }
+</style>
+</head>
+<body>
+<h2>📲 Mark Attendance</h2>
+<div id="session">Loading…</div>
+<form id="form">
+  <label>Roll Number <input name="roll" required autocomplete="off"></label>
+  <label id="pass_key">Pass Key <input name="pass_key" required autocomplete="off"></label>
+  <div id="registration" hidden>
+    <label>Full Name <input name="name"></label>
+    <label>Class <select name="student_class">
+      <option>B.Sc 1</option><option>B.Sc 2</option><option>B.Sc 3</option>
+    </select></label>
+    <label>Gmail Address <input name="gmail" type="email"></label>
+    <label>Mobile Number <input name="mobile"></label>
+  </div>
+  <button type="submit">Mark Attendance</button>
+</form>
+<div id="message"></div>
+<script>
+const form = document.getElementById("form");
+const message = document.getElementById("message");
+
+function show(text, kind) {
+  message.textContent = text;
+  message.className = kind;
+  message.style.display = "block";
+}
+
+// Signed QR: the scanned URL is the proof, no pass key and no lookup
+const qr = Object.fromEntries(new URLSearchParams(location.search));
+
+if (qr.sig) {
+  document.getElementById("pass_key").remove();
+  document.getElementById("session").textContent = qr.sub;
+} else {
+  fetch("/api/session").then(r => r.json()).then(s => {
+    document.getElementById("session").textContent = s.active
+      ? `${s.subject} · ${s.marked}/${s.capacity} marked · ${Math.floor(s.expires_in / 60)}m ${s.expires_in % 60}s left`
+      : "No Active Attendance Session";
+  });
+}
+
+const ERRORS = {
+  no_active_session: "No Active Attendance Session",
+  invalid_pass_key: "Invalid Pass Key",
+  invalid_qr: "QR code expired or invalid – scan the code on the classroom screen again",
+  session_expired: "⛔ Attendance Session Expired",
+};
+
+form.addEventListener("submit", async (event) => {
+  event.preventDefault();
+  const payload = Object.fromEntries(new FormData(form));
+  if (qr.sig) payload.qr = qr;
+  const response = await fetch("/api/mark", {
+    method: "POST",
+    headers: {"content-type": "application/json"},
+    body: JSON.stringify(payload),
+  });
+  const data = await response.json();
+
+  if (data.error === "registration_required") {
+    document.getElementById("registration").hidden = false;
+    document.querySelector("button").textContent = "Register & Mark Attendance";
+    show("New Registration: please fill in your details", "warn");
+  } else if (data.error) {
+    show(ERRORS[data.error] || data.error, "err");
+  } else if (data.result === "marked") {
+    form.hidden = true;
+    show("✅ Attendance Marked Successfully", "ok");
+  } else if (data.result === "already_marked") {
+    show("⚠ Attendance already marked today!", "warn");
+  } else if (data.result === "full") {
+    show(`Attendance Closed: ${data.capacity} Students Reached`, "err");
+  }
+});
+</script>
+</body>
+</html>
+"""
+
+# ============================================================
+# ENTRY POINT
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the attendance JSON API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("attendance_api needs uvicorn: pip install uvicorn")
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
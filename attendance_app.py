@@ -1,16 +1,34 @@
 import streamlit as st
-import qrcode
-import pandas as pd
-import uuid
-import io
-import time
-from datetime import datetime, timedelta, date
+import os
+from datetime import date
 today = date.today()
 import plotly.express as px
-import smtplib
-from email.mime.text import MIMEText
-import sqlite3
 from streamlit_autorefresh import st_autorefresh
+from attendance_qr import QRRenderCache
+from attendance_export import (
+    archive_monthly_trend,
+    archive_years,
+    archive_yearly_summary,
+    export_csv_file,
+    export_parquet,
+    parquet_available,
+)
+from attendance_reports import ReportBuilder, build_attendance_pdf, build_summary_pdf
+from attendance_core import (
+    CLASS_SUBJECTS,
+    DB_PATH,
+    MARK_DUPLICATE,
+    MARK_FULL,
+    ATTENDANCE_STATUSES,
+    PAGE_SIZES,
+    STUDENT_CLASSES,
+    AttendanceFilter,
+    AttendanceService,
+    Student,
+    email_settings_from,
+    now_ist,
+    read_roster,
+)
 # PAGE CONFIG
 # ============================================================
 if "logged_in" not in st.session_state:
@@ -83,98 +101,97 @@ div.stButton > button:hover {
 </style>
 """, unsafe_allow_html=True)
 # ============================================================
-# IST TIME FUNCTION
+# ATTENDANCE SERVICE (ONE PER PROCESS)
 # ============================================================
+# All database work lives in attendance_core; this page is a view over
+# the shared AttendanceService.
+
+def app_secrets() -> dict:
+    """st.secrets as a dict; empty without a secrets.toml, so the Student
+    portal still opens (only faculty login needs secrets)."""
+    if not st.secrets.load_if_toml_exists():
+        return {}
+    return dict(st.secrets)
+
+
+@st.cache_resource
+def get_service(db_path):
+    secrets = app_secrets()
+    return AttendanceService(
+        db_path,
+        email_settings_from(secrets),
+        qr_secret=secrets.get("QR_SIGNING_SECRET")
+    )
 
-def now_ist():
-    return datetime.utcnow() + timedelta(hours=5, minutes=30)
 
-# ============================================================
-# DATABASE CONNECTION (HIGH CONCURRENCY SAFE)
-# ============================================================
+service = get_service(DB_PATH)
 
-conn = sqlite3.connect(
-    "attendance.db",
-    check_same_thread=False,
-    timeout=30,
-    isolation_level=None
-)
 
-cursor = conn.cursor()
-cursor.execute("PRAGMA journal_mode=WAL;")
+@st.cache_resource
+def get_qr_images():
+    return QRRenderCache()
 
 
-# ================= ROLE SELECTOR =================
-st.sidebar.title("Portal Access")
-portal = st.sidebar.radio("Select Portal", ["Faculty", "Student"])
-# ============================================================
+qr_images = get_qr_images()
 
-# ============================================================
-# CREATE TABLES
-# ============================================================
 
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS students (
-    roll TEXT,
-    name TEXT,
-    class TEXT,
-    gmail TEXT,
-    mobile TEXT,
-    subject TEXT,
-    PRIMARY KEY (roll, subject)
-)
-""")
+@st.cache_resource
+def get_report_builder():
+    return ReportBuilder()
+
+
+reports = get_report_builder()
+
+
+# ================= KEYSET PAGINATION =================
+# Each paginated table keeps a stack of page cursors in session_state;
+# the stack starts over whenever its filters / page size change.
+
+def keyset_pager(key, reset_on):
+    if st.session_state.get(f"{key}_reset_on") != reset_on:
+        st.session_state[f"{key}_reset_on"] = reset_on
+        st.session_state[f"{key}_cursors"] = [None]
+    return st.session_state[f"{key}_cursors"]
 
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS sessions (
-    token TEXT PRIMARY KEY,
-    subject TEXT,
-    expiry TEXT
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS attendance (
-    roll TEXT,
-    name TEXT,
-    subject TEXT,
-    timestamp TEXT,
-    token TEXT,
-    status TEXT DEFAULT 'Present',
-    PRIMARY KEY (roll, token)
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS notices (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    title TEXT,
-    content TEXT,
-    link TEXT,
-    timestamp TEXT
-)
-""")
 
-try:
-    cursor.execute("ALTER TABLE attendance ADD COLUMN status TEXT DEFAULT 'Present'")
-except:
-    pass
+def load_page(cursors, load):
+    # A later page can empty out (its last rows deleted); step back to
+    # the nearest page that still has rows instead of stranding the user
+    page = load(cursors[-1])
+    while not len(page.rows) and len(cursors) > 1:
+        cursors.pop()
+        page = load(cursors[-1])
+    return page
 
-conn.commit()
+
+def page_controls(key, cursors, next_cursor):
+    # Callbacks move the cursor before the next run, saving a st.rerun()
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+
+    prev_col.button(
+        "◀ Previous", key=f"{key}_prev",
+        disabled=len(cursors) == 1, on_click=cursors.pop
+    )
+    info_col.caption(f"Page {len(cursors)}")
+    next_col.button(
+        "Next ▶", key=f"{key}_next",
+        disabled=next_cursor is None, on_click=cursors.append, args=(next_cursor,)
+    )
+
+
+# ================= ROLE SELECTOR =================
+st.sidebar.title("Portal Access")
+portal = st.sidebar.radio("Select Portal", ["Faculty", "Student"])
+# ============================================================
 
 # ============================================================
 # 📢 FLASH CLASS NOTICES
 # ============================================================
 st.markdown("## 📢 Class Notices")
 
-notices_df = pd.read_sql_query(
-    "SELECT * FROM notices ORDER BY id DESC LIMIT 5",
-    conn
-)
-
-if not notices_df.empty:
-    for _, row in notices_df.iterrows():
-        st.markdown(f"""
+def render_notice_banner(notices):
+    # Built once per notice version by service.notice_banner
+    return "".join(f"""
         <div style="
             background: linear-gradient(90deg, rgba(0,123,255,0.1), rgba(0,86,179,0.1));
             animation: pulse 2s infinite;
@@ -182,34 +199,20 @@ if not notices_df.empty:
             border-left: 5px solid #007bff;
             border-radius: 8px;
             margin-bottom: 10px;">
-            <b>{row['title']}</b><br>
-            {row['content']}<br>
-            {"🔗 <a href='"+row['link']+"' target='_blank'>Open Resource</a>" if row['link'] else ""}
-            <br><small>Posted on: {row['timestamp']}</small>
+            <b>{notice.title}</b><br>
+            {notice.content}<br>
+            {"🔗 <a href='"+notice.link+"' target='_blank'>Open Resource</a>" if notice.link else ""}
+            <br><small>Posted on: {notice.timestamp}</small>
         </div>
-        """, unsafe_allow_html=True)
-else:
-    st.info("No notices available.")
-# ============================================================
-# EMAIL FUNCTION
-# ============================================================
-
-def send_email(to_email, subject, body):
-    try:
-        sender = st.secrets["EMAIL_ADDRESS"]
-        password = st.secrets["EMAIL_PASSWORD"]
+        """ for notice in notices)
 
-        msg = MIMEText(body)
-        msg["Subject"] = subject
-        msg["From"] = sender
-        msg["To"] = to_email
 
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(sender, password)
-            server.send_message(msg)
-    except:
-        pass
+notice_banner = service.notice_banner(render_notice_banner)
 
+if notice_banner:
+    st.markdown(notice_banner, unsafe_allow_html=True)
+else:
+    st.info("No notices available.")
 ###################################################################################################################
 
 # ============================================================
@@ -224,6 +227,9 @@ if portal == "Faculty":
     if "active_qr_expiry" not in st.session_state:
         st.session_state.active_qr_expiry = None
 
+    if "active_qr_session" not in st.session_state:
+        st.session_state.active_qr_session = None
+
     # ---------------- SESSION STATE INIT ----------------
     if "faculty_logged_in" not in st.session_state:
         st.session_state.faculty_logged_in = False
@@ -255,6 +261,13 @@ if portal == "Faculty":
     # ---------------- LOGGED IN ----------------
     st.sidebar.success(f"Logged in as {st.session_state.faculty_name}")
 
+    outbox_counts = service.email_stats()
+    st.sidebar.caption(
+        f"📬 Emails – sent: {outbox_counts['sent']} · "
+        f"queued: {outbox_counts['pending'] + outbox_counts['sending']} · "
+        f"failed: {outbox_counts['failed']}"
+    )
+
     if st.sidebar.button("Logout"):
         st.session_state.faculty_logged_in = False
         st.session_state.faculty_name = ""
@@ -307,36 +320,7 @@ if portal == "Faculty":
         ["B.Sc 1", "B.Sc 2", "B.Sc 3"]
     )
 
-    class_subjects = {
-        "B.Sc 1": [
-            "Mechanics (PHYS101TH)",
-            "Electricity, Magnetism & EMT (PHYS102TH)",
-            "Mechanics (PHYS101PR)",
-            "Electricity, Magnetism & EMT (PHYS102PR)"
-        ],
-        "B.Sc 2": [
-            "Statistical & Thermal Physics (PHYS201TH)",
-            "Waves and Optics (PHYS202TH)",
-            "Computational Physics (PHYS204TH)",
-            "Electronic Circuits & Metwork Skills (PHYS205TH)",
-            "Statistical & Thermal Physics (PHYS201PR)",
-            "Waves and Optics (PHYS202PR)",
-            "Computational Physics (PHYS204SE)",
-            "Electronic Circuits & Metwork Skills (PHYS205SE)"
-        ],
-        "B.Sc 3": [
-            "Modern Physics (PHYS301TH)",
-            "Nuclear and Particle Physics (PHYS304TH)",
-            "Radiation Safety (PHYS307TH)",
-            "Renewable Energy and Energy Harvesting (PHYS310TH)",
-            "Modern Physics (PHYS301PR)",
-            "Nuclear and Particle Physics (PHYS304TU)",
-            "Radiation Safety (PHYS307SE)",
-            "Renewable Energy and Energy Harvesting (PHYS310TH)"
-        ]
-    }
-
-    subjects = class_subjects[selected_class]
+    subjects = CLASS_SUBJECTS[selected_class]
     subject = st.sidebar.selectbox("Select Subject", subjects)
 
     st.sidebar.markdown("---")
@@ -351,38 +335,38 @@ if portal == "Faculty":
         10, 300, 60, 10
     )
 
+    session_capacity = st.number_input(
+        "Max Students per QR",
+        min_value=1, max_value=1000, value=100, step=10
+    )
+
+    # MARK_PAGE_URL points the QR at attendance_api.py instead
+    app_url = st.secrets.get(
+        "MARK_PAGE_URL",
+        "https://qr-attendance-system-ngubz54ivcsykf753qfbdk.streamlit.app"
+    )
+
     # ---------------- GENERATE QR ----------------
     if st.sidebar.button("Generate QR"):
 
-        token = str(uuid.uuid4())
-        expiry = now_ist() + timedelta(seconds=validity_seconds)
-
-        cursor.execute(
-            "INSERT INTO sessions VALUES (?, ?, ?)",
-            (token, subject, expiry.strftime("%Y-%m-%d %H:%M:%S"))
+        qr_session = service.create_session(
+            subject, validity_seconds, int(session_capacity)
         )
-        conn.commit()
             
         # Save in session state
-        st.session_state.active_qr_token = token
-        st.session_state.active_qr_expiry = expiry
+        st.session_state.active_qr_token = qr_session.token
+        st.session_state.active_qr_expiry = qr_session.expiry
+        st.session_state.active_qr_session = qr_session
         
         # ================= SHOW ACTIVE QR =================
 
-        if st.session_state.active_qr_token:
+        if st.session_state.active_qr_token and not service.qr_tokens:
 
             expiry = st.session_state.active_qr_expiry
 
             if now_ist() < expiry:
 
-                app_url = "https://qr-attendance-system-ngubz54ivcsykf753qfbdk.streamlit.app"
-
-                qr = qrcode.make(app_url)
-                buf = io.BytesIO()
-                qr.save(buf)
-                buf.seek(0)
-
-                st.image(buf)
+                st.image(qr_images.render(app_url))
 
                 st.markdown(f"## 🔑 PASS KEY: `{st.session_state.active_qr_token}`")
                 st.info(f"Valid till {expiry.strftime('%H:%M:%S')}")
@@ -391,6 +375,40 @@ if portal == "Faculty":
                 st.warning("QR Session Expired")
                 st.session_state.active_qr_token = None
                 st.session_state.active_qr_expiry = None
+
+    # ================= ROTATING SIGNED QR =================
+    # With QR_SIGNING_SECRET set the QR carries a signed, time-slotted
+    # URL instead of a pass key; redraw it every rotation.
+
+    if service.qr_tokens and st.session_state.active_qr_session:
+
+        qr_session = st.session_state.active_qr_session
+
+        if now_ist() < qr_session.expiry:
+
+            st_autorefresh(
+                interval=service.qr_tokens.rotation_seconds * 1000,
+                key="qr_rotation"
+            )
+
+            slot = service.qr_tokens.current_slot()
+            st.image(qr_images.render(
+                service.qr_tokens.url(app_url, qr_session, slot)
+            ))
+
+            # Have the next frames encoded before the projector needs them
+            qr_images.prefetch(
+                service.qr_tokens.url(app_url, qr_session, slot + ahead)
+                for ahead in (1, 2)
+            )
+            st.info(
+                f"Valid till {qr_session.expiry.strftime('%H:%M:%S')} · "
+                f"code changes every {service.qr_tokens.rotation_seconds} s"
+            )
+
+        else:
+            st.warning("QR Session Expired")
+            st.session_state.active_qr_session = None
         
         
 
@@ -406,6 +424,34 @@ if portal == "Faculty":
         #st.info(f"Valid till {expiry.strftime('%H:%M:%S')}")
         #st.success(f"QR Generated (Valid for {validity_seconds} seconds)")
         
+    st.divider()
+    st.subheader("📋 Class Roster")
+
+    # Registering students here keeps the form off the QR window
+    with st.expander(f"Import Roster – {selected_class}"):
+
+        st.caption("CSV or XLSX with columns: roll, name, gmail, mobile (gmail and mobile optional)")
+        roster_file = st.file_uploader("Roster File", type=["csv", "xlsx"], key="roster_file")
+        roster_subjects = st.multiselect("Register For", subjects, default=subjects)
+        roster_update = st.checkbox("Update existing students", value=True)
+
+        if st.button("Import Roster", disabled=roster_file is None or not roster_subjects):
+            try:
+                roster = read_roster(roster_file, roster_file.name)
+            except (ValueError, ImportError) as exc:
+                st.error(f"Could not read roster: {exc}")
+            else:
+                result = service.import_roster(
+                    roster, selected_class, roster_subjects, roster_update
+                )
+                st.success(
+                    f"✅ {result.students} students: {result.inserted} registrations added, "
+                    f"{result.updated} updated ({result.seconds:.2f}s)"
+                )
+                if len(result.rejected):
+                    st.warning(f"{len(result.rejected)} rows skipped")
+                    st.dataframe(result.rejected, use_container_width=True, hide_index=True)
+
     st.divider()
     st.subheader("✏ Manual Attendance Management")
     
@@ -415,43 +461,19 @@ if portal == "Faculty":
     manual_roll = st.text_input("Student Roll Number")
     manual_status = st.selectbox(
         "Select Status",
-        ["Present", "Absent", "Leave (Fine Exempted)"]
+        ATTENDANCE_STATUSES
     )
     
     if st.button("Add / Update Attendance"):
     
         if manual_roll:
     
-            cursor.execute("""
-                SELECT name FROM students
-                WHERE roll=? AND subject=?
-            """, (manual_roll.upper(), subject))
-    
-            student = cursor.fetchone()
-    
-            if student:
-    
-                name = student[0]
-    
-                cursor.execute("""
-                    DELETE FROM attendance
-                    WHERE roll=? AND subject=? AND DATE(timestamp)=?
-                """, (manual_roll.upper(), subject, attendance_date))
+            updated = service.set_manual_attendance(
+                manual_roll.upper(), subject, attendance_date, manual_status
+            )
     
-                cursor.execute("""
-                    INSERT INTO attendance
-                    (roll, name, subject, timestamp, token, status)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    manual_roll.upper(),
-                    name,
-                    subject,
-                    f"{attendance_date} 09:00:00",
-                    "MANUAL",
-                    manual_status
-                ))
+            if updated:
     
-                conn.commit()
                 st.success("✅ Attendance Updated Successfully")
     
             else:
@@ -464,95 +486,11 @@ if portal == "Faculty":
     
     if st.button("Delete Attendance"):
     
-        cursor.execute("""
-            DELETE FROM attendance
-            WHERE roll=? AND subject=? AND DATE(timestamp)=?
-        """, (delete_roll.upper(), subject, delete_date))
+        service.delete_attendance(delete_roll.upper(), subject, delete_date)
     
-        conn.commit()
         st.success("Attendance Record Deleted")
     
 
-###################################################################################################################
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib import colors
-    from reportlab.lib.styles import ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import pagesizes
-    from reportlab.pdfbase.ttfonts import TTFont
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.platypus import Image
-    import io
-    from datetime import datetime
-    
-    
-    
-    
-    def generate_pdf(attendance_df, selected_class, subject, total_sessions, attendance_percent):
-    
-    
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=pagesizes.A4)
-        elements = []
-    
-    
-        styles = getSampleStyleSheet()
-    
-    
-        # University Header
-        elements.append(Paragraph(
-            "<b>G. B. Pant Memorial Govt. College</b>", styles['Title']))
-        elements.append(Paragraph(
-            "Rampur Bushahr, Shimla", styles['Normal']))
-        elements.append(Spacer(1, 0.2 * inch))
-    
-    
-        # Report Title
-        elements.append(Paragraph(
-            f"<b>Attendance Report</b>", styles['Heading2']))
-        elements.append(Spacer(1, 0.2 * inch))
-    
-    
-        # Report Details
-        elements.append(Paragraph(
-            f"Class: {selected_class}", styles['Normal']))
-        elements.append(Paragraph(
-            f"Subject: {subject}", styles['Normal']))
-        elements.append(Paragraph(
-            f"Total Sessions: {total_sessions}", styles['Normal']))
-        elements.append(Paragraph(
-            f"Attendance Percentage: {attendance_percent}%", styles['Normal']))
-        elements.append(Paragraph(
-            f"Generated On: {datetime.now().strftime('%d-%m-%Y %H:%M')}", styles['Normal']))
-    
-    
-        elements.append(Spacer(1, 0.3 * inch))
-    
-    
-        # Table Data
-        data = [attendance_df.columns.tolist()] + attendance_df.values.tolist()
-    
-    
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.green),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ]))
-    
-    
-        elements.append(table)
-    
-    
-        doc.build(elements)
-        buffer.seek(0)
-    
-    
-        return buffer
-    
-            
     st.divider()
     st.subheader("👩‍🏫 Teacher Panel – Publish Notice")
 
@@ -565,21 +503,12 @@ if portal == "Faculty":
         if st.button("📢 Publish Notice"):
 
             if notice_title and notice_content:
-                cursor.execute(
-                "INSERT INTO notices (title, content, link, timestamp) VALUES (?, ?, ?, ?)",
-                (
-                    notice_title,
-                    notice_content,
-                    notice_link,
-                    now_ist().strftime("%Y-%m-%d %H:%M:%S")
-                )
-            )
-            conn.commit()
+                service.publish_notice(notice_title, notice_content, notice_link)
 
-            st.success("✅ Notice Published Successfully")
-            st.rerun()
-        else:
-            st.warning("Please fill Title and Description")
+                st.success("✅ Notice Published Successfully")
+                st.rerun()
+            else:
+                st.warning("Please fill Title and Description")
         
         
     # ============================================================
@@ -589,14 +518,15 @@ if portal == "Faculty":
     st.divider()
     st.subheader("🗑 Manage / Delete Notices")
 
-    notices_df = pd.read_sql_query(
-        "SELECT * FROM notices ORDER BY id DESC",
-        conn
+    notice_page_size = st.selectbox("Notices per page", PAGE_SIZES, key="notices_page_size")
+    notice_cursors = keyset_pager("notices", notice_page_size)
+    notices_page = load_page(
+        notice_cursors, lambda cursor: service.notices_page(notice_page_size, cursor)
     )
 
-    if not notices_df.empty:
+    if notices_page.rows:
 
-        for _, row in notices_df.iterrows():
+        for row in notices_page.rows:
 
             col1, col2 = st.columns([6, 1])
 
@@ -607,27 +537,25 @@ if portal == "Faculty":
                     line-height: 1.2;
                     padding: 4px 0;
                 ">
-                    <b>{row['title']}</b><br>
-                    {row['content']}<br>
-                    <span style="color:gray;">🕒 {row['timestamp']}</span>
+                    <b>{row.title}</b><br>
+                    {row.content}<br>
+                    <span style="color:gray;">🕒 {row.timestamp}</span>
                 </div>
             """, unsafe_allow_html=True)
 
             with col2:
                 st.markdown('<div class="small-delete">', unsafe_allow_html=True)
-                delete_clicked = st.button("❌", key=f"delete_{row['id']}")
+                delete_clicked = st.button("❌", key=f"delete_{row.id}")
                 st.markdown('</div>', unsafe_allow_html=True)
 
                 if delete_clicked:
-                    cursor.execute(
-                        "DELETE FROM notices WHERE id = ?",
-                        (row['id'],)
-                    )
-                    conn.commit()
+                    service.delete_notice(row.id)
                     st.rerun()
 
             st.markdown("---")
 
+        page_controls("notices", notice_cursors, notices_page.next_cursor)
+
     else:
         st.info("No notices available to delete.")
 
@@ -639,21 +567,8 @@ if portal == "Faculty":
     #    conn,
     #    params=(subject,)
     #)
-    attendance_df = pd.read_sql_query(
-        """
-        SELECT *,
-               DATE(timestamp) as session_date
-        FROM attendance
-        WHERE subject=?
-        ORDER BY timestamp DESC
-        """,
-        conn,
-        params=(subject,)
-    )
-
-    total_present = len(attendance_df)
-    # Count distinct session dates for that subject
-    sessions_count = attendance_df["session_date"].nunique()
+    # Records and distinct session dates, counted in SQL
+    total_present, sessions_count = service.subject_attendance_totals(subject)
     #st.subheader("📋 Live Attendance Record")
     #st.dataframe(attendance_df, use_container_width=True)
     st.markdown("## 📊 Attendance Dashboard")
@@ -664,18 +579,13 @@ if portal == "Faculty":
 
     #total_present = len(attendance_df)
     # Count total sessions ONLY for selected subject
-    sessions_df = pd.read_sql_query("""
-        SELECT COUNT(DISTINCT DATE(expiry)) as total
-        FROM sessions
-        WHERE subject=?
-    """, conn, params=(subject,))
+    total_sessions = service.subject_session_days(subject)
     #sessions_df = pd.read_sql_query("""
      #   SELECT DISTINCT subject, DATE(expiry) as session_date
       #  FROM sessions
     #""", conn)
 
     #total_sessions = len(sessions_df)
-    total_sessions = sessions_df["total"][0]
     #st.metric("Total Sessions", total_sessions)
     
     #total_sessions = pd.read_sql_query(
@@ -724,93 +634,98 @@ if portal == "Faculty":
     st.markdown("<br>", unsafe_allow_html=True)
 
 
-    st.dataframe(attendance_df, use_container_width=True)
+    # ---------------- RECORDS (ONE PAGE AT A TIME) ----------------
 
+    with st.expander("🔎 Filter Records"):
+        filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+        filter_from = filter_col1.date_input("From", value=None, key="records_from")
+        filter_to = filter_col2.date_input("To", value=None, key="records_to")
+        filter_roll = filter_col3.text_input("Roll Number", key="records_roll")
+        filter_status = filter_col4.selectbox(
+            "Status", ("All",) + ATTENDANCE_STATUSES, key="records_status"
+        )
 
-    if not attendance_df.empty:
-        st.markdown("### 📥 Download PDF Report")
+    record_filters = AttendanceFilter(
+        filter_from,
+        filter_to,
+        filter_roll.strip() or None,
+        None if filter_status == "All" else filter_status
+    )
+    record_page_size = st.selectbox("Rows per page", PAGE_SIZES, key="records_page_size")
+    record_cursors = keyset_pager("records", (subject, record_filters, record_page_size))
+    records_page = load_page(record_cursors, lambda cursor: service.subject_attendance_page(
+        subject, record_filters, record_page_size, cursor
+    ))
 
+    st.dataframe(records_page.rows, use_container_width=True)
+    page_controls("records", record_cursors, records_page.next_cursor)
 
-        pdf_file = generate_pdf(
-            attendance_df,
-            selected_class,
-            subject,
-            total_sessions,
-            attendance_percent
-        )
 
+    if total_present:
+        st.markdown("### 📥 Download PDF Report")
 
-        st.download_button(
-            label="📄 Download Attendance Report (PDF)",
-            data=pdf_file,
-            file_name=f"{selected_class}_{subject}_Attendance_Report.pdf",
-            mime="application/pdf"
+        report_layout = st.radio(
+            "Report Layout",
+            ["Detailed records", "Student summary with daily grid"],
+            horizontal=True
         )
 
+        # Built only on request, in the background, once per data version
+        report_key = ("attendance_pdf", report_layout, selected_class, subject)
+        data_version = service.query_cache.data_version()
+        report_job = reports.job(report_key)
+        report = reports.latest(report_key)
+
+        def start_pdf_report(key, version, layout, report_class, report_subject, sessions, percent):
+            if layout == "Detailed records":
+                build = lambda progress: build_attendance_pdf(
+                    service, report_class, report_subject, sessions, percent,
+                    progress=progress
+                )
+            else:
+                build = lambda progress: build_summary_pdf(
+                    service, report_class, report_subject, progress=progress
+                )
+            reports.submit(key, version, build)
+
+        if report_job and report_job.error:
+            st.error(f"PDF report failed: {report_job.error}")
+            report_job = None
+
+        if report_job:
+            st_autorefresh(interval=1000, key="report_progress")
+            st.progress(report_job.progress, text="⏳ Building PDF report…")
+
+        elif report:
+            st.download_button(
+                label="📄 Download Attendance Report (PDF)",
+                data=report.data,
+                file_name=(
+                    f"{selected_class}_{subject}_Attendance_Report.pdf"
+                    if report_layout == "Detailed records"
+                    else f"{selected_class}_{subject}_Attendance_Summary.pdf"
+                ),
+                mime="application/pdf"
+            )
+            st.caption(
+                f"Generated at {report.built_at.strftime('%H:%M:%S')}"
+                + (" · records have changed since" if report.version != data_version else "")
+            )
+
+        if not report_job and (report is None or report.version != data_version):
+            st.button(
+                "🔄 Regenerate PDF Report" if report else "🛠 Generate PDF Report",
+                on_click=start_pdf_report,
+                args=(report_key, data_version, report_layout, selected_class,
+                      subject, total_sessions, attendance_percent)
+            )
+
         #total_sessions = pd.read_sql_query(
         #    "SELECT subject, COUNT(*) as Total_Classes FROM sessions GROUP BY subject",
         #    conn
         #)
         
-        total_sessions = pd.read_sql_query("""
-            SELECT subject,
-                COUNT(DISTINCT DATE(expiry)) as Total_Classes
-            FROM sessions
-            GROUP BY subject
-        """, conn)
-        
-        #total_classes = total_classes_df["Total_Classes"][0]
-        
-        attendance_df = pd.read_sql_query("""
-            SELECT *,
-                DATE(timestamp) as session_date
-            FROM attendance
-            WHERE subject=?
-        """, conn, params=(subject,))
-        
-        attendance_count = attendance_df.groupby(
-            ["roll", "subject"]
-        ).size().reset_index(name="Classes_Attended")
-        
-        present_df = attendance_df[
-            attendance_df["status"] == "Present"
-        ]
-        
-        leave_df = attendance_df[
-            attendance_df["status"] == "Leave (Fine Exempted)"
-        ]
-        
-        present_count = present_df.groupby(
-            ["roll", "subject"]
-        ).size().reset_index(name="Present_Count")
-        
-        leave_count = leave_df.groupby(
-            ["roll", "subject"]
-        ).size().reset_index(name="Leave_Count")
-        
-        merged = present_count.merge(
-            leave_count,
-            on=["roll", "subject"],
-            how="left"
-        ).fillna(0)
-        
-        merged = merged.merge(total_sessions, on="subject")
-        
-        merged["Attendance_%"] = (
-            merged["Present_Count"] /
-            (merged["Total_Classes"] - merged["Leave_Count"])
-            * 100
-        ).round(2)
-        
-        merged["Absent_Days"] = (
-            merged["Total_Classes"]
-            - merged["Present_Count"]
-            - merged["Leave_Count"]
-        )
-        
-        merged["Absent_Days"] = merged["Absent_Days"].clip(lower=0)
-        
-        merged["Fine (₹)"] = merged["Absent_Days"] * 1
+        merged = service.compute_summary(subject)
 #        merged = attendance_count.merge(total_sessions, on="subject")
 #        #merged["Attendance_%"] = (
 #        #    merged["Classes_Attended"] /
@@ -886,24 +801,125 @@ if portal == "Faculty":
 
         #st.dataframe(styled, use_container_width=True)
 
-        # EXPORT CURRENT SUBJECT
-        csv_subject = attendance_df.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            "Download Current Subject CSV",
-            csv_subject,
-            f"{subject}_attendance.csv",
-            "text/csv"
-        )
+        # ---------------- CSV EXPORTS (STREAMED, ON REQUEST) ----------------
 
-        # EXPORT ALL SUBJECTS
-        all_data = pd.read_sql_query("SELECT * FROM attendance", conn)
-        csv_all = all_data.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            "Download All Subjects CSV",
-            csv_all,
-            "all_attendance.csv",
-            "text/csv"
-        )
+        st.markdown("### 📥 Download CSV")
+        csv_option1, csv_option2 = st.columns(2)
+        csv_gzip = csv_option1.checkbox("Compress CSV (gzip)", key="csv_gzip")
+        csv_archive = csv_option2.checkbox("Include archived terms", key="csv_archive")
+
+        # download_button keeps the whole file in memory while it is shown,
+        # so it appears only on the run that prepared the export, and the
+        # temporary file is removed as soon as Streamlit has read it
+        def prepare_csv(key, export_subject, compress, include_archive):
+            st.session_state.csv_ready = (
+                key, export_csv_file(service, export_subject, compress, include_archive)
+            )
+
+        csv_ready = st.session_state.pop("csv_ready", None)
+
+        csv_col1, csv_col2 = st.columns(2)
+        for column, key, export_subject, label, file_stem in (
+            (csv_col1, ("subject", subject), subject, "Current Subject CSV", f"{subject}_attendance"),
+            (csv_col2, ("all",), None, "All Subjects CSV", "all_attendance"),
+        ):
+            with column:
+                if csv_ready and csv_ready[0] == key:
+                    export = csv_ready[1]
+                    try:
+                        with open(export.path, "rb") as export_file:
+                            st.download_button(
+                                f"Download {label}",
+                                export_file,
+                                file_stem + (".csv.gz" if export.compressed else ".csv"),
+                                "application/gzip" if export.compressed else "text/csv",
+                                key=f"download_{key[0]}"
+                            )
+                    finally:
+                        os.remove(export.path)
+                    st.caption(
+                        f"{export.rows} rows · prepared at {export.created_at.strftime('%H:%M:%S')} "
+                        "· available until the page next refreshes"
+                    )
+
+                st.button(
+                    f"🛠 Prepare {label}",
+                    key=f"prepare_{key[0]}",
+                    on_click=prepare_csv,
+                    args=(key, export_subject, csv_gzip, csv_archive)
+                )
+
+    # ================= MULTI-YEAR ANALYTICS (PARQUET ARCHIVE) =================
+
+    with st.expander("🗄 Multi-Year Analytics (Parquet Archive)"):
+        if not parquet_available():
+            st.info("Install pyarrow to build and query the Parquet archive.")
+
+        else:
+            def update_archive():
+                st.session_state.archive_export = export_parquet(service)
+
+            st.button("🔄 Update Archive from Live Database", on_click=update_archive)
+
+            archive_export = st.session_state.get("archive_export")
+            if archive_export:
+                st.caption(
+                    f"Archived {archive_export.attendance_rows} attendance and "
+                    f"{archive_export.session_rows} session rows in {archive_export.seconds:.1f}s"
+                )
+
+            academic_years = archive_years()
+            if not academic_years:
+                st.info("The archive is empty. Update it from the live database first.")
+
+            else:
+                archive_col1, archive_col2 = st.columns(2)
+                archive_scope = archive_col1.radio(
+                    "Scope",
+                    ["Selected subject", "Selected class", "All subjects"],
+                    horizontal=True,
+                    key="archive_scope"
+                )
+                selected_years = archive_col2.multiselect(
+                    "Academic Years",
+                    academic_years,
+                    default=academic_years[-3:],
+                    key="archive_years"
+                )
+
+                # Only what the scope selects is read from the archive
+                archive_filters = dict(
+                    academic_years=selected_years,
+                    student_class=selected_class if archive_scope == "Selected class" else None,
+                    subject=subject if archive_scope == "Selected subject" else None,
+                )
+
+                if selected_years and st.checkbox("Run archive query", key="archive_query"):
+                    yearly = archive_yearly_summary(**archive_filters)
+
+                    if yearly.empty:
+                        st.info("No archived records match this selection.")
+                    else:
+                        st.dataframe(yearly, use_container_width=True)
+
+                        trend = archive_monthly_trend(**archive_filters)
+                        fig = px.line(
+                            trend,
+                            x="Month",
+                            y="Present",
+                            color="academic_year",
+                            markers=True,
+                            category_orders={
+                                "Month": list(trend.sort_values("Month_No")["Month"].unique())
+                            }
+                        )
+                        fig.update_layout(
+                           plot_bgcolor="white",
+                           paper_bgcolor="white",
+                           title="Present Marks per Month, Year over Year",
+                           title_x=0.3
+                        )
+                        st.plotly_chart(fig, use_container_width=True)
 ##########################################################################################################################################
 
 # ============================================================
@@ -1182,6 +1198,10 @@ elif portal == "Student":
     if "attendance_done" not in st.session_state:
         st.session_state.attendance_done = False
 
+    # Signed-QR mode: check the scanned URL once, on arrival, in memory
+    if service.qr_tokens and not st.session_state.get("qr_session"):
+        st.session_state.qr_session = service.verify_qr(st.query_params.to_dict())
+
     # ------------------ STEP 1: LOGIN ------------------
 
     if not st.session_state.student_logged_in:
@@ -1199,31 +1219,33 @@ elif portal == "Student":
 
     # ------------------ STEP 2: FETCH ACTIVE SESSION ------------------
 
-    cursor.execute("""
-        SELECT * FROM sessions
-        WHERE expiry > ?
-        ORDER BY expiry DESC
-        LIMIT 1
-    """, (now_ist().strftime("%Y-%m-%d %H:%M:%S"),))
+    if service.qr_tokens:
+        active_session = st.session_state.qr_session
+
+        if not active_session:
+            st.error("QR code expired or invalid – scan the code on the classroom screen again")
+            st.stop()
 
-    active_session = cursor.fetchone()
+        if now_ist() > active_session.expiry:
+            st.error("⛔ Attendance Session Expired")
+            st.stop()
+    else:
+        active_session = service.active_session()
 
-    if not active_session:
-        st.error("No Active Attendance Session")
-        st.stop()
+        if not active_session:
+            st.error("No Active Attendance Session")
+            st.stop()
 
-    real_token = active_session[0]
-    subject_db = active_session[1]
-    expiry = datetime.strptime(active_session[2], "%Y-%m-%d %H:%M:%S")
+    subject_db = active_session.subject
+    expiry = active_session.expiry
+    capacity = active_session.capacity
 
     # ------------------ LIVE TIMER ------------------
 
     if not st.session_state.attendance_done:
         st_autorefresh(interval=1000, key="timerrefresh")
 
-    remaining_seconds = int((expiry - now_ist()).total_seconds())
-
-    mins, secs = divmod(max(remaining_seconds, 0), 60)
+    mins, secs = divmod(active_session.remaining_seconds(), 60)
 
     st.markdown(f"""
     <div style="
@@ -1238,37 +1260,32 @@ elif portal == "Student":
 
     # ------------------ STEP 3: PASS KEY ------------------
 
-    st.subheader("Enter Classroom Pass Key")
-    passkey = st.text_input("Pass Key").strip().upper()
+    if not service.qr_tokens:
+        st.subheader("Enter Classroom Pass Key")
+        passkey = st.text_input("Pass Key").strip().upper()
 
-    if not passkey:
-        st.stop()
+        if not passkey:
+            st.stop()
 
-    if passkey != real_token.upper():
-        st.error("Invalid Pass Key")
-        st.stop()
+        if not service.validate_pass_key(passkey):
+            st.error("Invalid Pass Key")
+            st.stop()
+
+    real_token = active_session.token
 
     # ------------------ LIVE COUNTER ------------------
 
-    cursor.execute(
-        "SELECT COUNT(*) FROM attendance WHERE UPPER(token)=?",
-        (passkey,)
-    )
-    count = cursor.fetchone()[0]
+    count = service.marked_count(real_token)
 
-    st.info(f"👥 Students Marked: {count}")
+    st.info(f"👥 Students Marked: {count} / {capacity}")
 
-    if count >= 100:
-        st.error("Attendance Closed: 100 Students Reached")
+    if count >= capacity:
+        st.error(f"Attendance Closed: {capacity} Students Reached")
         st.stop()
 
     # ------------------ CHECK REGISTRATION ------------------
 
-    cursor.execute(
-        "SELECT * FROM students WHERE roll=? AND subject=?",
-        (roll, subject_db)
-    )
-    registered = cursor.fetchone()
+    registered = service.find_student(roll, subject_db)
 
     # ============================================================
     # FIRST TIME REGISTRATION
@@ -1279,7 +1296,7 @@ elif portal == "Student":
         st.subheader("New Registration")
 
         name = st.text_input("Full Name")
-        student_class = st.selectbox("Class", ["B.Sc 1", "B.Sc 2", "B.Sc 3"])
+        student_class = st.selectbox("Class", STUDENT_CLASSES)
         gmail = st.text_input("Gmail Address")
         mobile = st.text_input("Mobile Number")
 
@@ -1290,51 +1307,22 @@ elif portal == "Student":
                 st.error("⛔ Attendance Session Expired")
                 st.stop()
 
-            today_date = now_ist().strftime("%Y-%m-%d")
+            result = service.mark_attendance(
+                roll, name, subject_db, real_token, gmail,
+                registration=Student(roll, name, student_class, gmail, mobile, subject_db)
+            )
 
-            cursor.execute("""
-                SELECT 1 FROM attendance
-                WHERE roll=? AND subject=? AND DATE(timestamp)=?
-            """, (roll, subject_db, today_date))
+            if result == MARK_FULL:
+                st.error(f"Attendance Closed: {capacity} Students Reached")
+                st.stop()
 
-            if cursor.fetchone():
+            if result == MARK_DUPLICATE:
                 st.warning("⚠ Attendance already marked today!")
                 st.stop()
 
-            try:
-                cursor.execute(
-                    "INSERT INTO students VALUES (?, ?, ?, ?, ?, ?)",
-                    (roll, name, student_class, gmail, mobile, subject_db)
-                )
-
-                cursor.execute(
-                    """INSERT INTO attendance 
-                       (roll, name, subject, timestamp, token, status)
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (
-                        roll,
-                        name,
-                        subject_db,
-                        now_ist().strftime("%Y-%m-%d %H:%M:%S"),
-                        passkey,
-                        "Present"
-                    )
-                )
-
-                conn.commit()
-
-                send_email(
-                    gmail,
-                    "Attendance Confirmed",
-                    f"Dear {name}, your attendance for {subject_db} is marked."
-                )
-
-                st.session_state.attendance_done = True
-                st.success("✅ Registered & Attendance Marked")
-                st.rerun()
-
-            except sqlite3.IntegrityError:
-                st.warning("Already registered or attendance marked.")
+            st.session_state.attendance_done = True
+            st.success("✅ Registered & Attendance Marked")
+            st.rerun()
 
     # ============================================================
     # ALREADY REGISTERED STUDENT
@@ -1342,8 +1330,8 @@ elif portal == "Student":
 
     else:
 
-        name = registered[1]
-        gmail = registered[3]
+        name = registered.name
+        gmail = registered.gmail
 
         if st.button("Mark Attendance"):
 
@@ -1352,46 +1340,21 @@ elif portal == "Student":
                 st.error("⛔ Attendance Session Expired")
                 st.stop()
 
-            today_date = now_ist().strftime("%Y-%m-%d")
+            result = service.mark_attendance(
+                roll, name, subject_db, real_token, gmail
+            )
 
-            cursor.execute("""
-                SELECT 1 FROM attendance
-                WHERE roll=? AND subject=? AND DATE(timestamp)=?
-            """, (roll, subject_db, today_date))
+            if result == MARK_FULL:
+                st.error(f"Attendance Closed: {capacity} Students Reached")
+                st.stop()
 
-            if cursor.fetchone():
+            if result == MARK_DUPLICATE:
                 st.warning("⚠ Attendance already marked today!")
                 st.stop()
 
-            try:
-                cursor.execute(
-                    """INSERT INTO attendance 
-                       (roll, name, subject, timestamp, token, status)
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (
-                        roll,
-                        name,
-                        subject_db,
-                        now_ist().strftime("%Y-%m-%d %H:%M:%S"),
-                        passkey,
-                        "Present"
-                    )
-                )
-
-                conn.commit()
-
-                send_email(
-                    gmail,
-                    "Attendance Confirmed",
-                    f"Dear {name}, your attendance for {subject_db} is marked."
-                )
-
-                st.session_state.attendance_done = True
-                st.success("✅ Attendance Marked Successfully")
-                st.rerun()
-
-            except sqlite3.IntegrityError:
-                st.warning("Attendance already marked.")
+            st.session_state.attendance_done = True
+            st.success("✅ Attendance Marked Successfully")
+            st.rerun()
 #############################################################################################################################################
 
 st.markdown("""
@@ -0,0 +1,423 @@
+"""
+Online backups of attendance.db.
+
+    python attendance_backup.py backup                 # delta if a full exists
+    python attendance_backup.py backup --full
+    python attendance_backup.py verify                 # latest backup
+    python attendance_backup.py restore backups/attendance-....json restored.db
+    python attendance_backup.py schedule --every 3600 --full-every 24 --keep 7
+
+Copying attendance.db with cp while the app runs misses whatever is still
+in the -wal file and can catch a half-written checkpoint. Every backup
+here goes through sqlite3.Connection.backup instead:
+
+- The source connection pins one WAL snapshot (an open read transaction)
+  for the whole copy. The copy is consistent as of that moment, and the
+  app's commits during the copy no longer force the backup API to
+  restart from page one. Readers never block writers in WAL mode.
+- Pages are copied BACKUP_PAGES_PER_STEP at a time with a short sleep
+  between steps, so the copy does not saturate the disk during class.
+
+The copy lands in backups/mirror.db, which is then hashed page by page.
+A full backup stores the whole file. A delta stores only the pages whose
+hash differs from the previous backup's manifest. Every manifest records
+the SHA-256 of the complete database it represents, so verify and
+restore can rebuild the chain (full + deltas) and check the result
+before trusting it. Each run reports its duration and pages per second.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from attendance_core import DB_PATH, now_ist, open_connection
+
+BACKUP_DIR = os.environ.get("ATTENDANCE_BACKUP_DIR", "backups")
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP_SECONDS = 0.005
+BACKUP_MIRROR_NAME = "mirror.db"
+BACKUP_FULL_EVERY = 24
+BACKUP_KEEP_FULL = 7
+
+DELTA_MAGIC = b"ATTDELTA1"
+DELTA_HEADER = struct.Struct(">9sIII")   # magic, page size, page count, pages stored
+DELTA_PAGE = struct.Struct(">I")         # 1-based page number, then the page
+
+
+@dataclass(frozen=True)
+class BackupResult:
+    manifest_path: str
+    kind: str
+    page_count: int
+    changed_pages: int
+    bytes_written: int
+    seconds: float
+    pages_per_second: float
+    sha256: str
+
+
+@dataclass(frozen=True)
+class VerifyResult:
+    manifest_path: str
+    ok: bool
+    sha256: str
+    integrity: str
+
+# ============================================================
+# ONLINE COPY (BACKUP API, ONE PINNED SNAPSHOT)
+# ============================================================
+
+def copy_database(db_path: str, target_path: str,
+                  pages_per_step: int = BACKUP_PAGES_PER_STEP,
+                  sleep: float = BACKUP_STEP_SLEEP_SECONDS) -> int:
+    """Copy ``db_path`` into ``target_path`` ``pages_per_step`` pages at a
+    time, ``sleep`` seconds apart; returns the page count.
+
+    The target is left as a standalone rollback-journal file, so it can be
+    opened (or hashed) without a -wal beside it.
+    """
+    os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+    source = open_connection(db_path, read_only=True)
+    target = sqlite3.connect(target_path, isolation_level=None)
+    progress = [0]
+
+    def pause(status, remaining, total):
+        # backup() itself only sleeps when a step is busy or locked; pause
+        # here after every step so the copy leaves the disk some room
+        progress[0] = total
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    try:
+        # Pin the snapshot: the copy then never sees (or restarts on) a
+        # commit made after this point
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        source.backup(
+            target,
+            pages=pages_per_step,
+            sleep=sleep,
+            progress=pause
+        )
+        source.execute("COMMIT")
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+
+    return progress[0]
+
+
+def _read_pages(path: str) -> tuple:
+    """(page size, page hashes, SHA-256 of the whole file)."""
+    with open(path, "rb") as db_file:
+        header = db_file.read(100)
+        page_size = struct.unpack(">H", header[16:18])[0]
+        page_size = 65536 if page_size == 1 else page_size
+
+        db_file.seek(0)
+        whole = hashlib.sha256()
+        hashes = []
+        while True:
+            page = db_file.read(page_size)
+            if not page:
+                break
+            whole.update(page)
+            hashes.append(hashlib.blake2b(page, digest_size=12).hexdigest())
+
+    return page_size, hashes, whole.hexdigest()
+
+# ============================================================
+# MANIFESTS AND CHAINS
+# ============================================================
+
+def _manifests(backup_dir: str) -> list:
+    """Manifest paths, oldest first (names sort by time)."""
+    if not os.path.isdir(backup_dir):
+        return []
+    return [
+        os.path.join(backup_dir, name)
+        for name in sorted(os.listdir(backup_dir))
+        if name.startswith("attendance-") and name.endswith(".json")
+    ]
+
+
+def _load_manifest(manifest_path: str) -> dict:
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)
+
+
+def _chain(manifest_path: str) -> list:
+    """Manifests from the full backup up to ``manifest_path``."""
+    backup_dir = os.path.dirname(manifest_path)
+    chain = []
+    while manifest_path:
+        manifest = _load_manifest(manifest_path)
+        chain.append(manifest)
+        manifest_path = (
+            os.path.join(backup_dir, manifest["parent"]) if manifest["parent"] else None
+        )
+    return chain[::-1]
+
+
+def restore_backup(manifest_path: str, target_path: str) -> str:
+    """Rebuild the database of a manifest at ``target_path`` and check its
+    SHA-256; raises ValueError when it does not match."""
+    backup_dir = os.path.dirname(manifest_path)
+    chain = _chain(manifest_path)
+
+    shutil.copyfile(os.path.join(backup_dir, chain[0]["data"]), target_path)
+
+    with open(target_path, "r+b") as db_file:
+        for manifest in chain[1:]:
+            with open(os.path.join(backup_dir, manifest["data"]), "rb") as delta:
+                magic, page_size, page_count, stored = DELTA_HEADER.unpack(
+                    delta.read(DELTA_HEADER.size)
+                )
+                if magic != DELTA_MAGIC:
+                    raise ValueError(f"{manifest['data']} is not a backup delta")
+
+                for _ in range(stored):
+                    (page_no,) = DELTA_PAGE.unpack(delta.read(DELTA_PAGE.size))
+                    db_file.seek((page_no - 1) * page_size)
+                    db_file.write(delta.read(page_size))
+                db_file.truncate(page_count * page_size)
+
+    _, _, sha256 = _read_pages(target_path)
+    if sha256 != chain[-1]["sha256"]:
+        raise ValueError(f"Restored database does not match {os.path.basename(manifest_path)}")
+    return target_path
+
+
+def verify_backup(manifest_path: str) -> VerifyResult:
+    """Restore into a temporary file: checksum plus PRAGMA integrity_check."""
+    fd, restored = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+
+    try:
+        try:
+            restore_backup(manifest_path, restored)
+        except (OSError, ValueError, struct.error) as exc:
+            return VerifyResult(manifest_path, False, "", str(exc))
+
+        _, _, sha256 = _read_pages(restored)
+        check_conn = sqlite3.connect(restored)
+        try:
+            integrity = check_conn.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            check_conn.close()
+        return VerifyResult(manifest_path, integrity == "ok", sha256, integrity)
+    finally:
+        os.remove(restored)
+
+# ============================================================
+# BACKUP
+# ============================================================
+
+def backup_database(db_path: str = DB_PATH, backup_dir: str = BACKUP_DIR,
+                    full: bool = False,
+                    pages_per_step: int = BACKUP_PAGES_PER_STEP) -> BackupResult:
+    """Take a backup: a delta against the latest manifest unless ``full``
+    (or there is nothing compatible to diff against)."""
+    started = time.perf_counter()
+    os.makedirs(backup_dir, exist_ok=True)
+    mirror = os.path.join(backup_dir, BACKUP_MIRROR_NAME)
+
+    copy_database(db_path, mirror, pages_per_step)
+    page_size, hashes, sha256 = _read_pages(mirror)
+
+    manifests = _manifests(backup_dir)
+    parent = _load_manifest(manifests[-1]) if manifests and not full else None
+    if parent and parent["page_size"] != page_size:
+        parent = None
+
+    now = now_ist()
+    name = f"attendance-{now:%Y%m%d-%H%M%S-%f}"
+
+    if parent is None:
+        data = f"{name}.db"
+        shutil.copyfile(mirror, os.path.join(backup_dir, data))
+        changed = list(range(len(hashes)))
+    else:
+        data = f"{name}.delta"
+        previous = parent["pages"]
+        changed = [
+            index for index, page_hash in enumerate(hashes)
+            if index >= len(previous) or previous[index] != page_hash
+        ]
+
+        with open(mirror, "rb") as source, open(os.path.join(backup_dir, data), "wb") as delta:
+            delta.write(DELTA_HEADER.pack(DELTA_MAGIC, page_size, len(hashes), len(changed)))
+            for index in changed:
+                source.seek(index * page_size)
+                delta.write(DELTA_PAGE.pack(index + 1))
+                delta.write(source.read(page_size))
+
+    seconds = time.perf_counter() - started
+    manifest = {
+        "kind": "full" if parent is None else "delta",
+        "created_at": now.isoformat(timespec="seconds"),
+        "source": os.path.abspath(db_path),
+        "parent": os.path.basename(manifests[-1]) if parent is not None else None,
+        "data": data,
+        "page_size": page_size,
+        "page_count": len(hashes),
+        "changed_pages": len(changed),
+        "sha256": sha256,
+        "seconds": round(seconds, 3),
+        "pages": hashes,
+    }
+
+    manifest_path = os.path.join(backup_dir, f"{name}.json")
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return BackupResult(
+        manifest_path,
+        manifest["kind"],
+        len(hashes),
+        len(changed),
+        os.path.getsize(os.path.join(backup_dir, data)),
+        seconds,
+        len(hashes) / seconds if seconds else float(len(hashes)),
+        sha256
+    )
+
+
+def prune_backups(backup_dir: str = BACKUP_DIR, keep_full: int = BACKUP_KEEP_FULL) -> int:
+    """Drop whole chains older than the newest ``keep_full`` full backups."""
+    manifests = _manifests(backup_dir)
+    fulls = [path for path in manifests if _load_manifest(path)["kind"] == "full"]
+    if len(fulls) <= keep_full:
+        return 0
+
+    oldest_kept = os.path.basename(fulls[-keep_full])
+    removed = 0
+    for path in manifests:
+        if os.path.basename(path) >= oldest_kept:
+            break
+        os.remove(os.path.join(backup_dir, _load_manifest(path)["data"]))
+        os.remove(path)
+        removed += 1
+    return removed
+
+
+def _report(result: BackupResult) -> str:
+    return (
+        f"{result.kind} backup: {result.page_count} pages "
+        f"({result.changed_pages} stored, {result.bytes_written / 1024:.0f} KiB) "
+        f"in {result.seconds:.2f}s, {result.pages_per_second:.0f} pages/s "
+        f"-> {result.manifest_path}"
+    )
+
+
+def run_schedule(db_path: str = DB_PATH, backup_dir: str = BACKUP_DIR,
+                 every_seconds: float = 3600, full_every: int = BACKUP_FULL_EVERY,
+                 keep_full: int = BACKUP_KEEP_FULL, verify: bool = True,
+                 runs: Optional[int] = None,
+                 log: Callable[[str], None] = print) -> None:
+    """Back up every ``every_seconds``: a full backup every ``full_every``
+    runs and deltas in between, each verified, old chains pruned."""
+    since_full = None
+    done = 0
+
+    while runs is None or done < runs:
+        started = time.monotonic()
+
+        if since_full is None:
+            manifests = _manifests(backup_dir)
+            since_full = len(_chain(manifests[-1])) - 1 if manifests else full_every
+
+        result = backup_database(db_path, backup_dir, full=since_full + 1 >= full_every)
+        since_full = 0 if result.kind == "full" else since_full + 1
+        log(_report(result))
+
+        if verify:
+            check = verify_backup(result.manifest_path)
+            log(f"verify: {'ok' if check.ok else 'FAILED'} ({check.integrity})")
+
+        removed = prune_backups(backup_dir, keep_full)
+        if removed:
+            log(f"pruned {removed} old backups")
+
+        done += 1
+        if runs is None or done < runs:
+            time.sleep(max(0.0, every_seconds - (time.monotonic() - started)))
+
+# ============================================================
+# ENTRY POINT
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Online backups of the attendance database")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dir", default=BACKUP_DIR, help="backup directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup = commands.add_parser("backup", help="take one backup")
+    backup.add_argument("--full", action="store_true")
+    backup.add_argument("--pages-per-step", type=int, default=BACKUP_PAGES_PER_STEP)
+
+    verify = commands.add_parser("verify", help="rebuild a backup and check it")
+    verify.add_argument("manifest", nargs="?", help="manifest .json (default: latest)")
+
+    restore = commands.add_parser("restore", help="rebuild a backup into a file")
+    restore.add_argument("manifest")
+    restore.add_argument("target")
+
+    schedule = commands.add_parser("schedule", help="back up at a fixed interval")
+    schedule.add_argument("--every", type=float, default=3600, help="seconds between backups")
+    schedule.add_argument("--full-every", type=int, default=BACKUP_FULL_EVERY)
+    schedule.add_argument("--keep", type=int, default=BACKUP_KEEP_FULL,
+                          help="full backups (with their deltas) to keep")
+    schedule.add_argument("--no-verify", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "backup":
+        print(_report(backup_database(args.db, args.dir, args.full, args.pages_per_step)))
+
+    elif args.command == "verify":
+        manifests = _manifests(args.dir)
+        manifest = args.manifest or (manifests[-1] if manifests else None)
+        if manifest is None:
+            raise SystemExit(f"No backups in {args.dir}")
+
+        check = verify_backup(manifest)
+        print(f"{manifest}: {'ok' if check.ok else 'FAILED'} "
+              f"(sha256 {check.sha256[:16]}…, {check.integrity})")
+        if not check.ok:
+            raise SystemExit(1)
+
+    elif args.command == "restore":
+        if os.path.exists(args.target):
+            raise SystemExit(f"{args.target} exists; restore into a new file")
+        try:
+            restore_backup(args.manifest, args.target)
+        except ValueError as exc:
+            os.remove(args.target)
+            raise SystemExit(str(exc))
+        print(f"Restored {args.manifest} to {args.target}")
+
+    elif args.command == "schedule":
+        try:
+            run_schedule(args.db, args.dir, args.every, args.full_every, args.keep,
+                         not args.no_verify)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1885 @@
+"""
+Headless core of the QR attendance system.
+
+Everything the Streamlit page (attendance_app.py) does with the database
+lives here: schema migrations, the connection manager and group-commit
+writer, the active-session cache, the email outbox and the
+AttendanceService facade that ties them together. Nothing in this module
+imports Streamlit, so the same code can back scripts, benchmarks and
+other front ends.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import smtplib
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from email.mime.text import MIMEText
+from typing import Callable, Iterator, Mapping, Optional
+from urllib.parse import urlencode
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# IST TIME FUNCTION
+# ============================================================
+
+def now_ist() -> datetime:
+    return datetime.utcnow() + timedelta(hours=5, minutes=30)
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+ACADEMIC_YEAR_START_MONTH = 7
+TERM_START_MONTHS = (1, 7)
+
+
+def academic_year(day: str) -> str:
+    """'2025-08-14' -> '2025-26': academic years run July to June."""
+    year, month = int(day[:4]), int(day[5:7])
+    start = year if month >= ACADEMIC_YEAR_START_MONTH else year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+def term_start(day: date) -> date:
+    """First day of the term (semester) that ``day`` falls in."""
+    month = max(start for start in TERM_START_MONTHS if start <= day.month)
+    return date(day.year, month, 1)
+
+DB_PATH = os.environ.get("ATTENDANCE_DB", "attendance.db")
+ARCHIVE_DB_PATH = os.environ.get("ATTENDANCE_ARCHIVE_DB", "attendance_archive.db")
+
+# ============================================================
+# SCHEMA MIGRATIONS (RUN ONCE PER PROCESS / DB FILE)
+# ============================================================
+# Each migration runs inside its own write transaction and bumps
+# PRAGMA user_version, so the schema version lives in the DB file.
+# Append new migrations; never edit one that has shipped.
+
+def _migration_base_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS students (
+        roll TEXT,
+        name TEXT,
+        class TEXT,
+        gmail TEXT,
+        mobile TEXT,
+        subject TEXT,
+        PRIMARY KEY (roll, subject)
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sessions (
+        token TEXT PRIMARY KEY,
+        subject TEXT,
+        expiry TEXT
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS attendance (
+        roll TEXT,
+        name TEXT,
+        subject TEXT,
+        timestamp TEXT,
+        token TEXT,
+        status TEXT DEFAULT 'Present',
+        PRIMARY KEY (roll, token)
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS notices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        content TEXT,
+        link TEXT,
+        timestamp TEXT
+    )
+    """)
+
+
+def _migration_attendance_status(conn):
+    # Databases created before the status column existed
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(attendance)")]
+    if "status" not in columns:
+        conn.execute("ALTER TABLE attendance ADD COLUMN status TEXT DEFAULT 'Present'")
+
+
+def _migration_day_columns_and_indexes(conn):
+    # Pass keys are compared upper-case; store tokens that way so lookups
+    # can use plain equality (and an index) instead of UPPER(token)
+    conn.execute("UPDATE sessions SET token = UPPER(token) WHERE token <> UPPER(token)")
+    conn.execute("UPDATE attendance SET token = UPPER(token) WHERE token <> UPPER(token)")
+
+    # Virtual generated columns: existing rows are backfilled for free and
+    # every future insert keeps them in sync without touching the writers
+    conn.execute("""
+        ALTER TABLE attendance ADD COLUMN day TEXT
+        GENERATED ALWAYS AS (substr(timestamp, 1, 10)) VIRTUAL
+    """)
+    conn.execute("""
+        ALTER TABLE sessions ADD COLUMN day TEXT
+        GENERATED ALWAYS AS (substr(expiry, 1, 10)) VIRTUAL
+    """)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_subject_day ON attendance (subject, day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_roll_subject_day ON attendance (roll, subject, day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_token ON attendance (token)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_subject_day ON sessions (subject, day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions (expiry)")
+
+
+def _migration_email_outbox(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        to_email TEXT NOT NULL,
+        subject TEXT,
+        body TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        claimed_at REAL,
+        last_error TEXT,
+        created_at TEXT,
+        sent_at TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at)")
+
+
+def _migration_session_counts(conn):
+    conn.execute("ALTER TABLE sessions ADD COLUMN capacity INTEGER NOT NULL DEFAULT 100")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS session_counts (
+        token TEXT PRIMARY KEY,
+        marked INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+    conn.execute("""
+        INSERT OR IGNORE INTO session_counts (token, marked)
+        SELECT s.token, (SELECT COUNT(*) FROM attendance a WHERE a.token = s.token)
+        FROM sessions s
+    """)
+
+    # The counter is maintained inside the same transaction as the
+    # attendance write, and the capacity check runs under the write lock,
+    # so concurrent submissions can never push a session past its cap.
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_count_init
+    AFTER INSERT ON sessions
+    BEGIN
+        INSERT OR IGNORE INTO session_counts (token, marked) VALUES (NEW.token, 0);
+    END
+    """)
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_capacity
+    BEFORE INSERT ON attendance
+    BEGIN
+        SELECT RAISE(ABORT, 'session full')
+        FROM session_counts c JOIN sessions s ON s.token = c.token
+        WHERE c.token = NEW.token AND c.marked >= s.capacity;
+    END
+    """)
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_count_insert
+    AFTER INSERT ON attendance
+    BEGIN
+        UPDATE session_counts SET marked = marked + 1 WHERE token = NEW.token;
+    END
+    """)
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_count_delete
+    AFTER DELETE ON attendance
+    BEGIN
+        UPDATE session_counts SET marked = marked - 1 WHERE token = OLD.token;
+    END
+    """)
+
+
+def _migration_unique_daily_attendance(conn):
+    # Keep the earliest record when legacy data has same-day duplicates;
+    # the others are kept aside in attendance_duplicates, not dropped
+    duplicates = """
+        FROM attendance
+        WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM attendance GROUP BY roll, subject, day
+        )
+    """
+    removed = conn.execute(f"SELECT COUNT(*) {duplicates}").fetchone()[0]
+
+    if removed:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS attendance_duplicates (
+                roll TEXT,
+                name TEXT,
+                subject TEXT,
+                timestamp TEXT,
+                token TEXT,
+                status TEXT,
+                removed_at TEXT
+            )
+        """)
+        conn.execute(
+            f"""INSERT INTO attendance_duplicates
+                SELECT roll, name, subject, timestamp, token, status, ? {duplicates}""",
+            (now_ist().strftime(TIMESTAMP_FORMAT),)
+        )
+        conn.execute(f"DELETE {duplicates}")
+        logger.warning(
+            "Moved %d same-day duplicate attendance rows to attendance_duplicates", removed
+        )
+
+    conn.execute("DROP INDEX IF EXISTS idx_attendance_roll_subject_day")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_roll_subject_day
+        ON attendance (roll, subject, day)
+    """)
+
+
+def _migration_attendance_keyset_index(conn):
+    # Matches the dashboard's ORDER BY timestamp DESC, roll DESC pages
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_attendance_subject_timestamp_roll
+        ON attendance (subject, timestamp DESC, roll DESC)
+    """)
+
+
+def _migration_attendance_summaries(conn):
+    # Per-student status counts and per-subject session days, kept
+    # current by triggers so the summary never rescans attendance
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS student_subject_summary (
+        roll TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        present_days INTEGER NOT NULL DEFAULT 0,
+        leave_days INTEGER NOT NULL DEFAULT 0,
+        absent_days INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (subject, roll)
+    ) WITHOUT ROWID
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS subject_session_days (
+        subject TEXT NOT NULL,
+        day TEXT NOT NULL,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (subject, day)
+    ) WITHOUT ROWID
+    """)
+
+    conn.execute("DELETE FROM student_subject_summary")
+    conn.execute(f"""
+        INSERT INTO student_subject_summary
+        (roll, subject, present_days, leave_days, absent_days)
+        SELECT roll, subject,
+               SUM(status IS 'Present'),
+               SUM(status IS '{LEAVE_STATUS}'),
+               SUM(status IS 'Absent')
+        FROM attendance
+        GROUP BY roll, subject
+    """)
+
+    conn.execute("DELETE FROM subject_session_days")
+    conn.execute("""
+        INSERT INTO subject_session_days (subject, day, sessions)
+        SELECT subject, substr(expiry, 1, 10), COUNT(*)
+        FROM sessions
+        GROUP BY subject, substr(expiry, 1, 10)
+    """)
+
+    add_counts = f"""
+        INSERT INTO student_subject_summary
+        (roll, subject, present_days, leave_days, absent_days)
+        VALUES (
+            NEW.roll, NEW.subject,
+            NEW.status IS 'Present',
+            NEW.status IS '{LEAVE_STATUS}',
+            NEW.status IS 'Absent'
+        )
+        ON CONFLICT (subject, roll) DO UPDATE SET
+            present_days = present_days + excluded.present_days,
+            leave_days = leave_days + excluded.leave_days,
+            absent_days = absent_days + excluded.absent_days;
+    """
+    remove_counts = f"""
+        UPDATE student_subject_summary SET
+            present_days = present_days - (OLD.status IS 'Present'),
+            leave_days = leave_days - (OLD.status IS '{LEAVE_STATUS}'),
+            absent_days = absent_days - (OLD.status IS 'Absent')
+        WHERE roll = OLD.roll AND subject = OLD.subject;
+    """
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_insert
+    AFTER INSERT ON attendance
+    BEGIN
+        {add_counts}
+    END
+    """)
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_delete
+    AFTER DELETE ON attendance
+    BEGIN
+        {remove_counts}
+    END
+    """)
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_summary_update
+    AFTER UPDATE OF roll, subject, status ON attendance
+    BEGIN
+        {remove_counts}
+        {add_counts}
+    END
+    """)
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_days_insert
+    AFTER INSERT ON sessions
+    BEGIN
+        INSERT INTO subject_session_days (subject, day, sessions)
+        VALUES (NEW.subject, substr(NEW.expiry, 1, 10), 1)
+        ON CONFLICT (subject, day) DO UPDATE SET sessions = sessions + 1;
+    END
+    """)
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_days_delete
+    AFTER DELETE ON sessions
+    BEGIN
+        UPDATE subject_session_days SET sessions = sessions - 1
+        WHERE subject = OLD.subject AND day = substr(OLD.expiry, 1, 10);
+        DELETE FROM subject_session_days
+        WHERE subject = OLD.subject AND day = substr(OLD.expiry, 1, 10) AND sessions <= 0;
+    END
+    """)
+
+
+def _migration_session_counts_cleanup(conn):
+    # Counters of deleted (archived) sessions are dropped with them
+    conn.execute("DELETE FROM session_counts WHERE token NOT IN (SELECT token FROM sessions)")
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_sessions_count_delete
+    AFTER DELETE ON sessions
+    BEGIN
+        DELETE FROM session_counts WHERE token = OLD.token;
+    END
+    """)
+
+
+SCHEMA_MIGRATIONS = [
+    (1, _migration_base_tables),
+    (2, _migration_attendance_status),
+    (3, _migration_day_columns_and_indexes),
+    (4, _migration_email_outbox),
+    (5, _migration_session_counts),
+    (6, _migration_unique_daily_attendance),
+    (7, _migration_attendance_keyset_index),
+    (8, _migration_attendance_summaries),
+    (9, _migration_session_counts_cleanup),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+
+def migrate_database(db_path: str) -> int:
+    migration_conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+
+    try:
+        current = migration_conn.execute("PRAGMA user_version").fetchone()[0]
+        if current >= SCHEMA_VERSION:
+            return current
+
+        if current == 0:
+            # Only takes effect on a brand-new file: lets the retention
+            # job hand freed pages back with PRAGMA incremental_vacuum
+            migration_conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        migration_conn.execute("PRAGMA journal_mode=WAL;")
+
+        for version, migration in SCHEMA_MIGRATIONS:
+            # Re-read under the write lock: another process may have migrated
+            migration_conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = migration_conn.execute("PRAGMA user_version").fetchone()[0]
+                if current < version:
+                    migration(migration_conn)
+                    migration_conn.execute(f"PRAGMA user_version = {version}")
+                migration_conn.execute("COMMIT")
+            except Exception:
+                migration_conn.execute("ROLLBACK")
+                raise
+
+        return SCHEMA_VERSION
+    finally:
+        migration_conn.close()
+
+
+
+# ============================================================
+# ACTIVE SESSION CACHE (SHARED BY ALL STUDENT RERUNS)
+# ============================================================
+
+ACTIVE_SESSION_TTL_SECONDS = 5
+
+
+@dataclass(frozen=True)
+class ActiveSession:
+    token: str
+    subject: str
+    expiry: datetime
+    capacity: int
+
+    def remaining_seconds(self) -> int:
+        return max(int((self.expiry - now_ist()).total_seconds()), 0)
+
+
+class ActiveSessionCache:
+    """Process-wide copy of the latest unexpired QR session.
+
+    Every student rerun reads from memory; SQLite is only queried once
+    per TTL window or after ``invalidate()`` (called by Generate QR).
+    """
+
+    def __init__(self, ttl_seconds: float = ACTIVE_SESSION_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._session: Optional[ActiveSession] = None
+        self._loaded_at: Optional[float] = None
+
+    def get(self, conn: sqlite3.Connection) -> Optional[ActiveSession]:
+        with self._lock:
+            fresh = (
+                self._loaded_at is not None
+                and time.monotonic() - self._loaded_at < self.ttl_seconds
+            )
+
+            if not fresh:
+                row = conn.execute("""
+                    SELECT token, subject, expiry, capacity FROM sessions
+                    WHERE expiry > ?
+                    ORDER BY expiry DESC
+                    LIMIT 1
+                """, (now_ist().strftime(TIMESTAMP_FORMAT),)).fetchone()
+
+                self._session = None
+                if row:
+                    self._session = ActiveSession(
+                        row[0],
+                        row[1],
+                        datetime.strptime(row[2], TIMESTAMP_FORMAT),
+                        row[3]
+                    )
+                self._loaded_at = time.monotonic()
+
+            # A cached session that has since expired means "no session"
+            if self._session and self._session.expiry <= now_ist():
+                return None
+
+            return self._session
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+# ============================================================
+# NOTICE BANNER CACHE (VERSIONED, BUMPED ON PUBLISH / DELETE)
+# ============================================================
+# Every rerun of every page shows the latest notices. They change only
+# through publish/delete, so the rows and the rendered banner are kept
+# per version and rebuilt only after bump().
+
+NOTICE_BANNER_SIZE = 5
+
+
+@dataclass(frozen=True)
+class Notice:
+    id: int
+    title: str
+    content: str
+    link: str
+    timestamp: str
+
+
+class NoticeCache:
+
+    def __init__(self, limit: int = NOTICE_BANNER_SIZE):
+        self.limit = limit
+        self.version = 0
+        self._lock = threading.Lock()
+        self._loaded_version: Optional[int] = None
+        self._notices: tuple = ()
+        self._rendered: dict = {}
+
+    def get(self, conn: sqlite3.Connection) -> tuple:
+        with self._lock:
+            if self._loaded_version != self.version:
+                self._notices = tuple(
+                    Notice(*row) for row in conn.execute(
+                        """SELECT id, title, content, link, timestamp FROM notices
+                           ORDER BY id DESC LIMIT ?""",
+                        (self.limit,)
+                    )
+                )
+                self._rendered = {}
+                self._loaded_version = self.version
+            return self._notices
+
+    def rendered(self, conn: sqlite3.Connection,
+                 render: Callable[[tuple], str]) -> str:
+        """``render(notices)``, called once per version and renderer."""
+        # Keyed by name: a Streamlit rerun redefines the same function
+        key = (render.__module__, render.__qualname__)
+        notices = self.get(conn)
+        with self._lock:
+            html = self._rendered.get(key)
+            if html is None:
+                html = self._rendered[key] = render(notices)
+            return html
+
+    def bump(self) -> None:
+        with self._lock:
+            self.version += 1
+
+# ============================================================
+# SIGNED ROTATING QR TOKENS (VERIFIED WITHOUT A DATABASE READ)
+# ============================================================
+# Optional mode (QR_SIGNING_SECRET): the QR URL carries the session
+# itself plus an HMAC over it and the current time slot. The faculty
+# screen re-signs every QR_ROTATION_SECONDS; a scanned URL is accepted
+# for QR_TOKEN_MAX_AGE_SECONDS, so a forwarded screenshot soon stops
+# working and the student path never has to look the session up.
+
+QR_ROTATION_SECONDS = 10
+QR_TOKEN_MAX_AGE_SECONDS = 45
+QR_PARAMS = ("sid", "sub", "exp", "cap", "t", "sig")
+
+
+class SignedQRTokens:
+
+    def __init__(self, secret: str,
+                 rotation_seconds: int = QR_ROTATION_SECONDS,
+                 max_age_seconds: int = QR_TOKEN_MAX_AGE_SECONDS):
+        self._key = secret.encode()
+        self.rotation_seconds = rotation_seconds
+        self.max_age_seconds = max_age_seconds
+
+    def current_slot(self) -> int:
+        return int(time.time() // self.rotation_seconds)
+
+    def _signature(self, sid: str, subject: str, expiry: str,
+                   capacity: str, slot: str) -> str:
+        message = "\x1f".join((sid, subject, expiry, capacity, slot)).encode()
+        return hmac.new(self._key, message, hashlib.sha256).hexdigest()[:32]
+
+    def params(self, session: ActiveSession, slot: Optional[int] = None) -> dict:
+        fields = {
+            "sid": session.token,
+            "sub": session.subject,
+            "exp": session.expiry.strftime(TIMESTAMP_FORMAT),
+            "cap": str(session.capacity),
+            "t": str(self.current_slot() if slot is None else slot),
+        }
+        fields["sig"] = self._signature(*fields.values())
+        return fields
+
+    def url(self, base_url: str, session: ActiveSession,
+            slot: Optional[int] = None) -> str:
+        return f"{base_url}?{urlencode(self.params(session, slot))}"
+
+    def verify(self, params: Mapping[str, str]) -> Optional[ActiveSession]:
+        """The session a scanned URL stands for, or None if forged/stale."""
+        try:
+            sid, subject, expiry, capacity, slot, signature = (
+                str(params[name]) for name in QR_PARAMS
+            )
+        except KeyError:
+            return None
+
+        if not hmac.compare_digest(
+            signature, self._signature(sid, subject, expiry, capacity, slot)
+        ):
+            return None
+
+        try:
+            age = time.time() - int(slot) * self.rotation_seconds
+            session = ActiveSession(
+                sid,
+                subject,
+                datetime.strptime(expiry, TIMESTAMP_FORMAT),
+                int(capacity)
+            )
+        except ValueError:
+            return None
+
+        # One slot of slack for clock skew between the faculty and API hosts
+        if not -self.rotation_seconds <= age <= self.max_age_seconds:
+            return None
+        if session.expiry <= now_ist():
+            return None
+        return session
+
+# ============================================================
+# MARK ATTENDANCE (ONE STATEMENT ON THE PEAK PATH)
+# ============================================================
+# The unique (roll, subject, day) index rejects duplicates and the
+# capacity trigger rejects late arrivals, so a single INSERT tells all
+# three outcomes apart without a prior SELECT.
+
+MARK_OK = "marked"
+MARK_DUPLICATE = "already_marked"
+MARK_FULL = "full"
+
+
+def mark_attendance(conn: sqlite3.Connection, roll: str, name: str,
+                    subject: str, token: str) -> str:
+    timestamp = now_ist().strftime(TIMESTAMP_FORMAT)
+    try:
+        row = conn.execute(
+            """INSERT INTO attendance
+               (roll, name, subject, timestamp, token, status)
+               VALUES (?, ?, ?, ?, ?, 'Present')
+               ON CONFLICT DO NOTHING
+               RETURNING rowid""",
+            (roll, name, subject, timestamp, token)
+        ).fetchone()
+    except sqlite3.IntegrityError as exc:
+        if "session full" not in str(exc):
+            raise
+        # The capacity trigger fires before the conflict check, so a
+        # student re-scanning a full session still hears "already marked"
+        already = conn.execute(
+            "SELECT 1 FROM attendance WHERE roll=? AND subject=? AND day=?",
+            (roll, subject, timestamp[:10])
+        ).fetchone()
+        return MARK_DUPLICATE if already else MARK_FULL
+
+    return MARK_OK if row else MARK_DUPLICATE
+
+# ============================================================
+# GROUP-COMMIT WRITER (ONE THREAD OWNS THE WRITE CONNECTION)
+# ============================================================
+# Jobs are callables taking the write connection. The writer drains the
+# queue for a few milliseconds, runs every job in its own savepoint
+# inside one transaction, commits once, then resolves each job's future
+# with its result (or its own exception). A burst of 100 submissions
+# becomes a handful of commits instead of 100 competing for the lock.
+
+WRITE_GROUP_WINDOW_SECONDS = 0.005
+WRITE_GROUP_MAX_JOBS = 256
+WRITE_RESULT_TIMEOUT_SECONDS = 30
+
+WriteJob = Callable[[sqlite3.Connection], object]
+
+
+class GroupCommitWriter:
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(
+            target=self._run, name="attendance-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, job: WriteJob) -> Future:
+        future: Future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def _run(self) -> None:
+        write_conn = open_connection(self.db_path)
+
+        while True:
+            group = [self._queue.get()]
+            deadline = time.monotonic() + WRITE_GROUP_WINDOW_SECONDS
+
+            while len(group) < WRITE_GROUP_MAX_JOBS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    group.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._commit_group(write_conn, group)
+
+    def _commit_group(self, write_conn: sqlite3.Connection, group: list) -> None:
+        outcomes = []
+
+        try:
+            write_conn.execute("BEGIN IMMEDIATE")
+
+            for job, future in group:
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                write_conn.execute("SAVEPOINT job")
+                try:
+                    result = job(write_conn)
+                except Exception as exc:
+                    write_conn.execute("ROLLBACK TO job")
+                    write_conn.execute("RELEASE job")
+                    outcomes.append((future, None, exc))
+                else:
+                    write_conn.execute("RELEASE job")
+                    outcomes.append((future, result, None))
+
+            write_conn.execute("COMMIT")
+
+        except Exception as exc:
+            logger.exception("Write group of %d jobs failed", len(group))
+            if write_conn.in_transaction:
+                write_conn.execute("ROLLBACK")
+            for _, future in group:
+                if future.done():
+                    continue
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(exc)
+            return
+
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+# ============================================================
+# DATABASE CONNECTION MANAGER (READ POOL + SINGLE WRITER)
+# ============================================================
+# Threads never share a connection: each thread leases its own
+# read-only connection from a small pool (handed back when the thread
+# exits), and every write goes through the one GroupCommitWriter.
+
+READ_POOL_MAX_IDLE = 16
+
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def open_connection(db_path: str, read_only: bool = False) -> sqlite3.Connection:
+    new_conn = sqlite3.connect(
+        db_path,
+        check_same_thread=False,
+        timeout=30,
+        isolation_level=None
+    )
+    for pragma in CONNECTION_PRAGMAS:
+        new_conn.execute(pragma)
+    if read_only:
+        new_conn.execute("PRAGMA query_only=ON")
+    return new_conn
+
+
+class _ReaderLease:
+    __slots__ = ("conn", "__weakref__")
+
+
+class ConnectionManager:
+
+    def __init__(self, db_path: str, archive_path: Optional[str] = None,
+                 read_only: bool = False):
+        self.db_path = db_path
+        self.archive_path = archive_path
+        migrate_database(db_path)
+
+        self._local = threading.local()
+        self._idle: queue.SimpleQueue = queue.SimpleQueue()
+        self.writer = None if read_only else GroupCommitWriter(db_path)
+
+    def reader(self) -> sqlite3.Connection:
+        lease = getattr(self._local, "lease", None)
+
+        if lease is None:
+            lease = _ReaderLease()
+            try:
+                lease.conn = self._idle.get_nowait()
+            except queue.Empty:
+                lease.conn = open_connection(self.db_path, read_only=True)
+
+            # Return the connection to the pool once this thread is gone
+            weakref.finalize(lease, self._release, lease.conn)
+            self._local.lease = lease
+
+        return lease.conn
+
+    def submit(self, job: WriteJob) -> Future:
+        if self.writer is None:
+            raise RuntimeError("This service was opened read-only")
+        return self.writer.submit(job)
+
+    def write(self, job: WriteJob):
+        return self.submit(job).result(timeout=WRITE_RESULT_TIMEOUT_SECONDS)
+
+    def attach_archive(self, read_conn: sqlite3.Connection) -> bool:
+        """Attach the retention archive as ``archive`` on a reader, once
+        it exists; query_only keeps it read-only there too."""
+        if any(row[1] == "archive" for row in read_conn.execute("PRAGMA database_list")):
+            return True
+        if not self.archive_path or not os.path.exists(self.archive_path):
+            return False
+
+        read_conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+        return True
+
+    def _release(self, read_conn: sqlite3.Connection) -> None:
+        if self._idle.qsize() < READ_POOL_MAX_IDLE:
+            self._idle.put(read_conn)
+        else:
+            read_conn.close()
+
+# ============================================================
+# QUERY RESULT CACHE (KEYED ON PRAGMA data_version)
+# ============================================================
+# PRAGMA data_version on one dedicated connection changes whenever any
+# other connection (our writer, another app process) commits. Results
+# are cached with the version they were read at, so a dashboard rerun
+# with no write in between is served from memory. Cached DataFrames are
+# shared between sessions and must be treated as read-only.
+
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+QUERY_CACHE_ENTRY_OVERHEAD = 1024
+
+
+def _result_size(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return QUERY_CACHE_ENTRY_OVERHEAD
+
+
+class QueryCache:
+
+    def __init__(self, db_path: str, max_bytes: int = QUERY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._probe = open_connection(db_path, read_only=True)
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def data_version(self) -> int:
+        with self._lock:
+            return self._probe.execute("PRAGMA data_version").fetchone()[0]
+
+    def get(self, key, load: Callable[[], object]):
+        version = self.data_version()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # A write landing during load only makes the entry look older
+        # than it is, so the next call reloads; never the reverse
+        value = load()
+        size = _result_size(value)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+
+            if size <= self.max_bytes:
+                self._entries[key] = (version, value, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, _, evicted) = self._entries.popitem(last=False)
+                    self._bytes -= evicted
+
+        return value
+
+
+def cached_query(method):
+    """Memoize a read-only AttendanceService method in its QueryCache."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        return self.query_cache.get(key, lambda: method(self, *args, **kwargs))
+
+    return wrapper
+
+# ============================================================
+# EMAIL OUTBOX
+# ============================================================
+# Emails are written to the email_outbox table and delivered by one
+# background thread per process over a single reused SMTP connection,
+# so marking attendance never waits on a TLS handshake.
+
+EMAIL_BATCH_SIZE = 25
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_RETRY_BASE_SECONDS = 30
+EMAIL_RETRY_MAX_SECONDS = 3600
+EMAIL_POLL_SECONDS = 5
+EMAIL_IDLE_DISCONNECT_SECONDS = 120
+EMAIL_STALE_CLAIM_SECONDS = 600
+
+
+@dataclass(frozen=True)
+class EmailSettings:
+    sender: Optional[str] = None
+    password: Optional[str] = None
+    host: str = "smtp.gmail.com"
+    port: int = 465
+    use_ssl: bool = True
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.sender and self.password)
+
+
+def email_settings_from(values: Mapping) -> EmailSettings:
+    """EmailSettings from EMAIL_* / SMTP_* keys (os.environ or st.secrets)."""
+    return EmailSettings(
+        sender=values.get("EMAIL_ADDRESS"),
+        password=values.get("EMAIL_PASSWORD"),
+        host=values.get("SMTP_HOST", "smtp.gmail.com"),
+        port=int(values.get("SMTP_PORT", 465)),
+        use_ssl=str(values.get("SMTP_USE_SSL", "1")).lower() not in ("0", "false", "no")
+    )
+
+
+class EmailOutbox:
+
+    def __init__(self, db: ConnectionManager, settings: EmailSettings,
+                 start_sender: bool = True):
+        self.db = db
+        self.settings = settings
+
+        self._wake = threading.Event()
+        self._server = None
+        self._last_used = 0.0
+
+        # Without credentials the sender would only claim rows and burn
+        # their attempts; leave them to a process that can deliver them
+        self._thread = None
+        if start_sender and settings.configured:
+            self._thread = threading.Thread(
+                target=self._run, name="email-outbox", daemon=True
+            )
+            self._thread.start()
+
+    # ---------------- PRODUCER SIDE ----------------
+
+    def enqueue(self, conn: sqlite3.Connection, to_email: str,
+                subject: str, body: str) -> None:
+        conn.execute(
+            """INSERT INTO email_outbox (to_email, subject, body, created_at)
+               VALUES (?, ?, ?, ?)""",
+            (to_email, subject, body, now_ist().strftime(TIMESTAMP_FORMAT))
+        )
+        self._wake.set()
+
+    def stats(self, conn: sqlite3.Connection) -> dict:
+        counts = {"pending": 0, "sending": 0, "sent": 0, "failed": 0}
+        for status, total in conn.execute(
+            "SELECT status, COUNT(*) FROM email_outbox GROUP BY status"
+        ):
+            counts[status] = total
+        return counts
+
+    # ---------------- SENDER THREAD ----------------
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(EMAIL_POLL_SECONDS)
+            self._wake.clear()
+
+            try:
+                while self._send_batch():
+                    pass
+            except Exception:
+                logger.exception("Email outbox batch failed")
+
+            if self._server and time.monotonic() - self._last_used > EMAIL_IDLE_DISCONNECT_SECONDS:
+                self._disconnect()
+
+    @staticmethod
+    def _claim_batch(write_conn: sqlite3.Connection) -> list:
+        now = time.time()
+
+        # Claim rows atomically so several app processes can share one outbox
+        return write_conn.execute("""
+            UPDATE email_outbox
+            SET status = 'sending', claimed_at = ?
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND claimed_at < ?)
+                ORDER BY id
+                LIMIT ?
+            )
+            RETURNING id, to_email, subject, body, attempts
+        """, (now, now, now - EMAIL_STALE_CLAIM_SECONDS, EMAIL_BATCH_SIZE)).fetchall()
+
+    def _send_batch(self) -> bool:
+        batch = self.db.write(self._claim_batch)
+        if not batch:
+            return False
+
+        sent = []
+        retries = []
+
+        for outbox_id, to_email, subject, body, attempts in batch:
+            msg = MIMEText(body)
+            msg["Subject"] = subject
+            msg["From"] = self.settings.sender
+            msg["To"] = to_email
+
+            try:
+                self._deliver(msg)
+                sent.append(outbox_id)
+            except (smtplib.SMTPException, OSError) as exc:
+                retries.append((outbox_id, attempts + 1, str(exc)))
+
+        now = time.time()
+        sent_at = now_ist().strftime(TIMESTAMP_FORMAT)
+
+        def record_results(write_conn):
+            write_conn.executemany(
+                """UPDATE email_outbox
+                   SET status = 'sent', attempts = attempts + 1,
+                       sent_at = ?, last_error = NULL
+                   WHERE id = ?""",
+                [(sent_at, outbox_id) for outbox_id in sent]
+            )
+            write_conn.executemany(
+                """UPDATE email_outbox
+                   SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+                   WHERE id = ?""",
+                [
+                    (
+                        "failed" if attempts >= EMAIL_MAX_ATTEMPTS else "pending",
+                        attempts,
+                        now + min(
+                            EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+                            EMAIL_RETRY_MAX_SECONDS
+                        ),
+                        error,
+                        outbox_id
+                    )
+                    for outbox_id, attempts, error in retries
+                ]
+            )
+
+        self.db.write(record_results)
+
+        return len(batch) == EMAIL_BATCH_SIZE
+
+    def _deliver(self, msg: MIMEText) -> None:
+        try:
+            self._connection().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Pooled connection went stale; reconnect once and retry
+            self._disconnect()
+            self._connection().send_message(msg)
+        self._last_used = time.monotonic()
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._server is None:
+            settings = self.settings
+            if not settings.sender or not settings.password:
+                raise smtplib.SMTPException("EMAIL_ADDRESS / EMAIL_PASSWORD not configured")
+
+            if settings.use_ssl:
+                server = smtplib.SMTP_SSL(settings.host, settings.port, timeout=30)
+            else:
+                server = smtplib.SMTP(settings.host, settings.port, timeout=30)
+
+            try:
+                server.login(settings.sender, settings.password)
+            except smtplib.SMTPNotSupportedError:
+                # Local relays / test stand-ins without AUTH
+                pass
+
+            self._server = server
+        return self._server
+
+    def _disconnect(self) -> None:
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+# ============================================================
+# ROSTER IMPORT (VALIDATED IN PANDAS, LOADED IN ONE TRANSACTION)
+# ============================================================
+# Faculty upload a class roster (CSV or XLSX) before term, so students
+# are already registered when the QR window opens. Checks run on whole
+# columns at once; only the clean rows reach the writer, as a single
+# executemany job.
+
+ROSTER_COLUMNS = ("roll", "name", "gmail", "mobile")
+ROSTER_REQUIRED_COLUMNS = ("roll", "name")
+ROSTER_HEADER_ALIASES = {
+    "roll no": "roll",
+    "roll no.": "roll",
+    "roll number": "roll",
+    "full name": "name",
+    "student name": "name",
+    "email": "gmail",
+    "gmail address": "gmail",
+    "mobile number": "mobile",
+    "phone": "mobile",
+}
+ROSTER_GMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+ROSTER_MOBILE_PATTERN = r"^(?:\+?91)?\d{10}$"
+
+
+@dataclass(frozen=True)
+class RosterImport:
+    students: int
+    inserted: int
+    updated: int
+    rejected: pd.DataFrame
+    seconds: float
+
+
+def read_roster(source, filename: str) -> pd.DataFrame:
+    """Load a roster upload as text columns; XLSX needs openpyxl."""
+    if filename.lower().endswith(".xls"):
+        raise ValueError("Old .xls workbooks are not supported; save the roster as .xlsx or CSV")
+    if filename.lower().endswith(".xlsx"):
+        frame = pd.read_excel(source, dtype=str)
+    else:
+        frame = pd.read_csv(source, dtype=str, skipinitialspace=True)
+
+    frame.columns = [
+        ROSTER_HEADER_ALIASES.get(column, column)
+        for column in frame.columns.astype(str).str.strip().str.lower()
+    ]
+    missing = [column for column in ROSTER_REQUIRED_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f"Roster is missing column(s): {', '.join(missing)}")
+    return frame
+
+
+def validate_roster(frame: pd.DataFrame) -> tuple:
+    """(clean, rejected): normalised unique students, and the rows that
+    were dropped with the spreadsheet line and a reason."""
+    roster = pd.DataFrame({
+        column: (
+            frame[column].astype("string").str.strip().fillna("")
+            if column in frame.columns
+            else pd.Series("", index=frame.index, dtype="string")
+        )
+        for column in ROSTER_COLUMNS
+    })
+    roster.insert(0, "line", frame.index + 2)
+
+    roster["roll"] = roster["roll"].str.upper()
+    roster["name"] = roster["name"].str.replace(r"\s+", " ", regex=True)
+    roster["gmail"] = roster["gmail"].str.lower()
+    roster["mobile"] = roster["mobile"].str.replace(r"\.0$|[\s()\-]", "", regex=True)
+
+    roster = roster[(roster[list(ROSTER_COLUMNS)] != "").any(axis=1)]
+    roster = roster.drop_duplicates(subset=list(ROSTER_COLUMNS))
+
+    reason = pd.Series("", index=roster.index, dtype="string")
+    checks = (
+        (roster["roll"] == "", "missing roll"),
+        (roster["name"] == "", "missing name"),
+        ((roster["gmail"] != "") & ~roster["gmail"].str.match(ROSTER_GMAIL_PATTERN),
+         "invalid gmail"),
+        ((roster["mobile"] != "") & ~roster["mobile"].str.match(ROSTER_MOBILE_PATTERN),
+         "invalid mobile"),
+        (roster["roll"].duplicated(keep=False) & (roster["roll"] != ""),
+         "roll listed twice with different details"),
+    )
+    for failed, message in checks:
+        reason = reason.mask((reason == "") & failed, message)
+
+    rejected = roster[reason != ""].assign(reason=reason[reason != ""])
+    clean = roster[reason == ""].drop(columns="line").reset_index(drop=True)
+    return clean, rejected.reset_index(drop=True)
+
+# ============================================================
+# ATTENDANCE SERVICE (WHAT THE PAGES CALL)
+# ============================================================
+
+LEAVE_STATUS = "Leave (Fine Exempted)"
+ATTENDANCE_STATUSES = ("Present", "Absent", LEAVE_STATUS)
+FINE_PER_ABSENT_DAY = 1
+PAGE_SIZES = (25, 50, 100, 250)
+REPORT_CHUNK_ROWS = 500
+REPORT_CHUNK_STUDENTS = 200
+ATTENDANCE_RECORD_COLUMNS = (
+    "roll", "name", "subject", "timestamp", "token", "status", "session_date"
+)
+STUDENT_CLASSES = ("B.Sc 1", "B.Sc 2", "B.Sc 3")
+CLASS_SUBJECTS = {
+    "B.Sc 1": [
+        "Mechanics (PHYS101TH)",
+        "Electricity, Magnetism & EMT (PHYS102TH)",
+        "Mechanics (PHYS101PR)",
+        "Electricity, Magnetism & EMT (PHYS102PR)"
+    ],
+    "B.Sc 2": [
+        "Statistical & Thermal Physics (PHYS201TH)",
+        "Waves and Optics (PHYS202TH)",
+        "Computational Physics (PHYS204TH)",
+        "Electronic Circuits & Metwork Skills (PHYS205TH)",
+        "Statistical & Thermal Physics (PHYS201PR)",
+        "Waves and Optics (PHYS202PR)",
+        "Computational Physics (PHYS204SE)",
+        "Electronic Circuits & Metwork Skills (PHYS205SE)"
+    ],
+    "B.Sc 3": [
+        "Modern Physics (PHYS301TH)",
+        "Nuclear and Particle Physics (PHYS304TH)",
+        "Radiation Safety (PHYS307TH)",
+        "Renewable Energy and Energy Harvesting (PHYS310TH)",
+        "Modern Physics (PHYS301PR)",
+        "Nuclear and Particle Physics (PHYS304TU)",
+        "Radiation Safety (PHYS307SE)",
+        "Renewable Energy and Energy Harvesting (PHYS310TH)"
+    ]
+}
+
+
+def _fetch_chunks(cursor: sqlite3.Cursor, chunk_size: int) -> Iterator[list]:
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _fetch_snapshot(conn: sqlite3.Connection, statements: list,
+                    chunk_size: int) -> Iterator[list]:
+    """Chunks of several SELECTs, all read in one transaction (snapshot)."""
+    owns_transaction = not conn.in_transaction
+    if owns_transaction:
+        conn.execute("BEGIN")
+
+    try:
+        for sql, params in statements:
+            yield from _fetch_chunks(conn.execute(sql, params), chunk_size)
+    finally:
+        if owns_transaction:
+            conn.execute("COMMIT")
+
+
+def _with_fines(merged: pd.DataFrame) -> pd.DataFrame:
+    """Add Attendance_%, Absent_Days and the fine to summary rows that
+    carry Present_Count, Leave_Count and Total_Classes."""
+    merged["Attendance_%"] = (
+        merged["Present_Count"] /
+        (merged["Total_Classes"] - merged["Leave_Count"])
+        * 100
+    ).round(2)
+
+    merged["Absent_Days"] = (
+        merged["Total_Classes"]
+        - merged["Present_Count"]
+        - merged["Leave_Count"]
+    ).clip(lower=0)
+
+    merged["Fine (₹)"] = merged["Absent_Days"] * FINE_PER_ABSENT_DAY
+    return merged
+
+
+@dataclass(frozen=True)
+class Student:
+    roll: str
+    name: str
+    student_class: str
+    gmail: str
+    mobile: str
+    subject: str
+
+
+@dataclass(frozen=True)
+class AttendanceFilter:
+    start: Optional[date] = None
+    end: Optional[date] = None
+    roll: Optional[str] = None
+    status: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Page:
+    """One keyset page; pass ``next_cursor`` back to get the following one."""
+    rows: object
+    next_cursor: Optional[tuple]
+
+
+@dataclass(frozen=True)
+class StudentDays:
+    """One student's counts and per-day statuses for a subject."""
+    roll: str
+    name: str
+    present: int
+    leave: int
+    absent: int
+    statuses: dict
+
+
+class AttendanceService:
+    """One per process: owns the connections, caches and worker threads.
+
+    ``read_only`` services (exports, report workers) start neither the
+    writer nor the email sender.
+    """
+
+    def __init__(self, db_path: str = DB_PATH,
+                 email_settings: Optional[EmailSettings] = None,
+                 qr_secret: Optional[str] = None,
+                 archive_path: Optional[str] = ARCHIVE_DB_PATH,
+                 read_only: bool = False):
+        self.db = ConnectionManager(db_path, archive_path, read_only)
+        self.query_cache = QueryCache(db_path)
+        self.sessions = ActiveSessionCache()
+        self.notices = NoticeCache()
+        self.outbox = EmailOutbox(
+            self.db, email_settings or EmailSettings(), start_sender=not read_only
+        )
+        self.qr_tokens = SignedQRTokens(qr_secret) if qr_secret else None
+
+    # ---------------- QR SESSIONS ----------------
+
+    def create_session(self, subject: str, validity_seconds: int,
+                       capacity: int = 100) -> ActiveSession:
+        session = ActiveSession(
+            str(uuid.uuid4()).upper(),
+            subject,
+            (now_ist() + timedelta(seconds=validity_seconds)).replace(microsecond=0),
+            int(capacity)
+        )
+
+        self.db.write(lambda write_conn: write_conn.execute(
+            "INSERT INTO sessions (token, subject, expiry, capacity) VALUES (?, ?, ?, ?)",
+            (
+                session.token,
+                session.subject,
+                session.expiry.strftime(TIMESTAMP_FORMAT),
+                session.capacity
+            )
+        ))
+        self.sessions.invalidate()
+        return session
+
+    def active_session(self) -> Optional[ActiveSession]:
+        return self.sessions.get(self.db.reader())
+
+    def validate_pass_key(self, passkey: str) -> Optional[ActiveSession]:
+        session = self.active_session()
+        if session and passkey.strip().upper() == session.token.upper():
+            return session
+        return None
+
+    def verify_qr(self, params: Mapping[str, str]) -> Optional[ActiveSession]:
+        """Signed-QR mode only: check a scanned URL's parameters in memory."""
+        if self.qr_tokens is None:
+            return None
+        return self.qr_tokens.verify(params)
+
+    def marked_count(self, token: str) -> int:
+        counter = self.db.reader().execute(
+            "SELECT marked FROM session_counts WHERE token=?",
+            (token,)
+        ).fetchone()
+        return counter[0] if counter else 0
+
+    # ---------------- STUDENTS ----------------
+
+    def find_student(self, roll: str, subject: str) -> Optional[Student]:
+        row = self.db.reader().execute(
+            "SELECT roll, name, class, gmail, mobile, subject FROM students WHERE roll=? AND subject=?",
+            (roll, subject)
+        ).fetchone()
+        return Student(*row) if row else None
+
+    def register_student(self, student: Student) -> bool:
+        """Insert a roster entry; False if (roll, subject) already exists."""
+        return bool(self.db.write(lambda write_conn: write_conn.execute(
+            """INSERT INTO students VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT DO NOTHING""",
+            (
+                student.roll, student.name, student.student_class,
+                student.gmail, student.mobile, student.subject
+            )
+        ).rowcount))
+
+    def import_roster(self, roster: pd.DataFrame, student_class: str,
+                      subjects: list, update_existing: bool = True) -> RosterImport:
+        """Register every valid roster row for each of ``subjects`` in one
+        write transaction. Existing entries get the roster's name and class
+        (and gmail / mobile where given) unless ``update_existing`` is False."""
+        started = time.perf_counter()
+        clean, rejected = validate_roster(roster)
+
+        rows = clean.merge(pd.DataFrame({"subject": list(subjects)}), how="cross")
+        rows.insert(2, "class", student_class)
+        params = list(rows[
+            ["roll", "name", "class", "gmail", "mobile", "subject"]
+        ].itertuples(index=False, name=None))
+
+        on_conflict = """
+            DO UPDATE SET
+                name = excluded.name,
+                class = excluded.class,
+                gmail = COALESCE(NULLIF(excluded.gmail, ''), students.gmail),
+                mobile = COALESCE(NULLIF(excluded.mobile, ''), students.mobile)
+            WHERE students.name IS NOT excluded.name
+               OR students.class IS NOT excluded.class
+               OR (excluded.gmail <> '' AND students.gmail IS NOT excluded.gmail)
+               OR (excluded.mobile <> '' AND students.mobile IS NOT excluded.mobile)
+        """ if update_existing else "DO NOTHING"
+        count_sql = (
+            f"SELECT COUNT(*) FROM students WHERE subject IN ({','.join('?' * len(subjects))})"
+        )
+
+        def load(write_conn):
+            before = write_conn.execute(count_sql, list(subjects)).fetchone()[0]
+            changes = write_conn.total_changes
+            write_conn.executemany(
+                f"""INSERT INTO students (roll, name, class, gmail, mobile, subject)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (roll, subject) {on_conflict}""",
+                params
+            )
+            changes = write_conn.total_changes - changes
+            inserted = write_conn.execute(count_sql, list(subjects)).fetchone()[0] - before
+            return inserted, changes - inserted
+
+        inserted, updated = self.db.write(load) if params else (0, 0)
+        return RosterImport(
+            len(clean), inserted, updated, rejected, time.perf_counter() - started
+        )
+
+    # ---------------- MARKING ----------------
+
+    def submit_mark_attendance(self, roll: str, name: str, subject: str,
+                               token: str, gmail: Optional[str] = None,
+                               registration: Optional[Student] = None) -> Future:
+        """Queue a student's mark (and optional first-time registration).
+
+        The future resolves to MARK_OK, MARK_DUPLICATE or MARK_FULL. The
+        confirmation email is queued in the same transaction as the mark.
+        """
+        outbox = self.outbox
+
+        def job(write_conn):
+            if registration:
+                write_conn.execute(
+                    """INSERT INTO students VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT DO NOTHING""",
+                    (
+                        registration.roll, registration.name,
+                        registration.student_class, registration.gmail,
+                        registration.mobile, registration.subject
+                    )
+                )
+
+            result = mark_attendance(write_conn, roll, name, subject, token)
+
+            if result == MARK_OK and gmail:
+                outbox.enqueue(
+                    write_conn,
+                    gmail,
+                    "Attendance Confirmed",
+                    f"Dear {name}, your attendance for {subject} is marked."
+                )
+
+            return result
+
+        return self.db.submit(job)
+
+    def mark_attendance(self, roll: str, name: str, subject: str, token: str,
+                        gmail: Optional[str] = None,
+                        registration: Optional[Student] = None) -> str:
+        return self.submit_mark_attendance(
+            roll, name, subject, token, gmail, registration
+        ).result(timeout=WRITE_RESULT_TIMEOUT_SECONDS)
+
+    def set_manual_attendance(self, roll: str, subject: str, day: date,
+                              status: str) -> bool:
+        """Replace a student's record for one day; False if not registered."""
+        student = self.find_student(roll, subject)
+        if not student:
+            return False
+
+        def update_attendance(write_conn):
+            write_conn.execute("""
+                DELETE FROM attendance
+                WHERE roll=? AND subject=? AND day=?
+            """, (roll, subject, day.isoformat()))
+
+            write_conn.execute("""
+                INSERT INTO attendance
+                (roll, name, subject, timestamp, token, status)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                roll,
+                student.name,
+                subject,
+                f"{day.isoformat()} 09:00:00",
+                "MANUAL",
+                status
+            ))
+
+        self.db.write(update_attendance)
+        return True
+
+    def delete_attendance(self, roll: str, subject: str, day: date) -> int:
+        return self.db.write(lambda write_conn: write_conn.execute("""
+            DELETE FROM attendance
+            WHERE roll=? AND subject=? AND day=?
+        """, (roll, subject, day.isoformat())).rowcount)
+
+    # ---------------- DASHBOARD ----------------
+
+    @cached_query
+    def subject_attendance_page(self, subject: str,
+                                filters: AttendanceFilter = AttendanceFilter(),
+                                page_size: int = PAGE_SIZES[0],
+                                cursor: Optional[tuple] = None) -> Page:
+        """Newest-first page of a subject's records, keyed on (timestamp, roll)."""
+        clauses = ["subject = ?"]
+        params: list = [subject]
+
+        if filters.start:
+            clauses.append("timestamp >= ?")
+            params.append(filters.start.isoformat())
+        if filters.end:
+            clauses.append("timestamp < ?")
+            params.append((filters.end + timedelta(days=1)).isoformat())
+        if filters.roll:
+            clauses.append("roll = ?")
+            params.append(filters.roll.strip().upper())
+        if filters.status:
+            clauses.append("status = ?")
+            params.append(filters.status)
+        if cursor:
+            clauses.append("(timestamp, roll) < (?, ?)")
+            params.extend(cursor)
+
+        # One extra row tells whether a next page exists
+        rows = pd.read_sql_query(
+            f"""
+            SELECT roll, name, subject, timestamp, token, status,
+                   day as session_date
+            FROM attendance
+            WHERE {" AND ".join(clauses)}
+            ORDER BY timestamp DESC, roll DESC
+            LIMIT ?
+            """,
+            self.db.reader(),
+            params=(*params, page_size + 1)
+        )
+
+        if len(rows) <= page_size:
+            return Page(rows, None)
+
+        rows = rows.iloc[:page_size]
+        last = rows.iloc[-1]
+        return Page(rows, (last["timestamp"], last["roll"]))
+
+    # ---------------- REPORT STREAMS (UNCACHED, CHUNKED) ----------------
+
+    def iter_subject_attendance(self, subject: str,
+                                chunk_size: int = REPORT_CHUNK_ROWS) -> Iterator[list]:
+        """The subject's records newest first, ATTENDANCE_RECORD_COLUMNS
+        tuples, one keyset chunk at a time."""
+        conn = self.db.reader()
+        cursor: tuple = ()
+
+        while True:
+            rows = conn.execute(
+                f"""
+                SELECT roll, name, subject, timestamp, token, status, day
+                FROM attendance
+                WHERE subject = ? {"AND (timestamp, roll) < (?, ?)" if cursor else ""}
+                ORDER BY timestamp DESC, roll DESC
+                LIMIT ?
+                """,
+                (subject, *cursor, chunk_size)
+            ).fetchall()
+
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            cursor = (rows[-1][3], rows[-1][0])
+
+    def iter_attendance_records(self, subject: Optional[str] = None,
+                                chunk_size: int = REPORT_CHUNK_ROWS,
+                                include_archive: bool = False) -> Iterator[list]:
+        """ATTENDANCE_RECORD_COLUMNS tuples for one subject (newest first)
+        or the whole table (by subject and day), fetched from open cursors.
+
+        Both orders follow an index, so SQLite steps the rows out as they
+        are consumed without a sort. With ``include_archive`` the archived
+        terms follow (one subject) or precede (whole table) the live rows,
+        read in the same transaction so a concurrent retention run can't
+        make a row appear twice or not at all.
+        """
+        conn = self.db.reader()
+        query = f"""
+            SELECT roll, name, subject, timestamp, token, status, day
+            FROM {{schema}}.attendance
+            {"WHERE subject = ? ORDER BY timestamp DESC, roll DESC" if subject
+             else "ORDER BY subject, day"}
+        """
+        schemas = ["main"]
+        if include_archive and self.db.attach_archive(conn):
+            schemas = ["main", "archive"] if subject else ["archive", "main"]
+
+        return _fetch_snapshot(
+            conn,
+            [(query.format(schema=schema), (subject,) if subject else ()) for schema in schemas],
+            chunk_size
+        )
+
+    def iter_session_records(self, chunk_size: int = REPORT_CHUNK_ROWS,
+                             include_archive: bool = False) -> Iterator[list]:
+        """(token, subject, expiry, capacity, day) for every session, by
+        subject and day; archived sessions first with ``include_archive``."""
+        conn = self.db.reader()
+        query = """
+            SELECT token, subject, expiry, capacity, day
+            FROM {schema}.sessions
+            ORDER BY subject, day
+        """
+        schemas = ["main"]
+        if include_archive and self.db.attach_archive(conn):
+            schemas = ["archive", "main"]
+
+        return _fetch_snapshot(
+            conn, [(query.format(schema=schema), ()) for schema in schemas], chunk_size
+        )
+
+    def attendance_days(self, subject: str) -> list:
+        """Every session day plus any day with a (manual) record."""
+        return [row[0] for row in self.db.reader().execute("""
+            SELECT day FROM subject_session_days WHERE subject = ?
+            UNION
+            SELECT DISTINCT day FROM attendance WHERE subject = ?
+            ORDER BY 1
+        """, (subject, subject))]
+
+    def iter_student_days(self, subject: str,
+                          first_day: Optional[str] = None,
+                          last_day: Optional[str] = None,
+                          chunk_size: int = REPORT_CHUNK_STUDENTS) -> Iterator[list]:
+        """StudentDays by roll, a chunk of students at a time.
+
+        Counts come from student_subject_summary; statuses are limited to
+        [first_day, last_day] so a month of the grid loads only that month.
+        """
+        conn = self.db.reader()
+        last_roll = ""
+
+        while True:
+            students = conn.execute("""
+                SELECT s.roll, COALESCE(st.name, ''),
+                       s.present_days, s.leave_days, s.absent_days
+                FROM student_subject_summary s
+                LEFT JOIN students st ON st.roll = s.roll AND st.subject = s.subject
+                WHERE s.subject = ? AND s.roll > ?
+                  AND s.present_days + s.leave_days + s.absent_days > 0
+                ORDER BY s.roll
+                LIMIT ?
+            """, (subject, last_roll, chunk_size)).fetchall()
+
+            if not students:
+                return
+
+            rolls = [student[0] for student in students]
+            statuses: dict = {roll: {} for roll in rolls}
+            for roll, day, status in conn.execute(
+                f"""
+                SELECT roll, day, status FROM attendance
+                WHERE subject = ? AND roll IN ({",".join("?" * len(rolls))})
+                  AND day BETWEEN ? AND ?
+                """,
+                (subject, *rolls, first_day or "", last_day or "9999-12-31")
+            ):
+                statuses[roll][day] = status
+
+            yield [StudentDays(*student, statuses[student[0]]) for student in students]
+
+            if len(students) < chunk_size:
+                return
+            last_roll = rolls[-1]
+
+    @cached_query
+    def subject_attendance_totals(self, subject: str) -> tuple:
+        """(records, distinct days) for a subject, without loading the rows."""
+        return self.db.reader().execute(
+            "SELECT COUNT(*), COUNT(DISTINCT day) FROM attendance WHERE subject=?",
+            (subject,)
+        ).fetchone()
+
+    @cached_query
+    def subject_session_days(self, subject: str) -> int:
+        return self.db.reader().execute("""
+            SELECT COUNT(*) FROM subject_session_days WHERE subject=?
+        """, (subject,)).fetchone()[0]
+
+    @cached_query
+    def compute_summary(self, subject: str) -> pd.DataFrame:
+        """Per-student present/leave counts, attendance % and fine."""
+        total_classes = self.subject_session_days(subject)
+
+        # Read from the trigger-maintained summary, one row per student
+        merged = pd.read_sql_query(
+            """
+            SELECT roll, subject,
+                   present_days AS Present_Count,
+                   leave_days AS Leave_Count
+            FROM student_subject_summary
+            WHERE subject=? AND present_days > 0
+            ORDER BY roll
+            """,
+            self.db.reader(),
+            params=(subject,)
+        )
+
+        if not total_classes:
+            # No QR sessions yet: nothing to compute a percentage against
+            merged = merged.iloc[0:0]
+
+        merged["Total_Classes"] = total_classes
+        return _with_fines(merged)
+
+    def term_summaries(self) -> tuple:
+        """(totals, summaries) for every subject at once.
+
+        totals has one row per subject with records, distinct days and
+        session days (one grouped pass over attendance); summaries is
+        compute_summary() for all subjects stacked, ordered by subject
+        and roll.
+        """
+        conn = self.db.reader()
+
+        totals = pd.read_sql_query(
+            """
+            SELECT a.subject,
+                   COUNT(*) AS records,
+                   COUNT(DISTINCT a.day) AS days,
+                   COALESCE(d.sessions, 0) AS Total_Classes
+            FROM attendance a
+            LEFT JOIN (
+                SELECT subject, COUNT(*) AS sessions
+                FROM subject_session_days GROUP BY subject
+            ) d ON d.subject = a.subject
+            GROUP BY a.subject
+            ORDER BY a.subject
+            """,
+            conn
+        )
+
+        summaries = pd.read_sql_query(
+            """
+            SELECT s.roll, s.subject,
+                   s.present_days AS Present_Count,
+                   s.leave_days AS Leave_Count,
+                   d.sessions AS Total_Classes
+            FROM student_subject_summary s
+            JOIN (
+                SELECT subject, COUNT(*) AS sessions
+                FROM subject_session_days GROUP BY subject
+            ) d ON d.subject = s.subject
+            WHERE s.present_days > 0
+            ORDER BY s.subject, s.roll
+            """,
+            conn
+        )
+        return totals, _with_fines(summaries)
+
+    # ---------------- NOTICES ----------------
+
+    @cached_query
+    def latest_notices(self, limit: Optional[int] = 5) -> pd.DataFrame:
+        if limit is None:
+            return pd.read_sql_query(
+                "SELECT * FROM notices ORDER BY id DESC",
+                self.db.reader()
+            )
+        return pd.read_sql_query(
+            "SELECT * FROM notices ORDER BY id DESC LIMIT ?",
+            self.db.reader(),
+            params=(limit,)
+        )
+
+    @cached_query
+    def notices_page(self, page_size: int = PAGE_SIZES[0],
+                     cursor: Optional[tuple] = None) -> Page:
+        """Newest-first page of notices, keyed on id."""
+        rows = [
+            Notice(*row) for row in self.db.reader().execute(
+                """SELECT id, title, content, link, timestamp FROM notices
+                   WHERE id < ?
+                   ORDER BY id DESC
+                   LIMIT ?""",
+                (cursor[0] if cursor else sys.maxsize, page_size + 1)
+            )
+        ]
+
+        if len(rows) <= page_size:
+            return Page(tuple(rows), None)
+        return Page(tuple(rows[:page_size]), (rows[page_size - 1].id,))
+
+    def notice_banner(self, render: Callable[[tuple], str]) -> str:
+        """The latest notices rendered by ``render``, cached per version."""
+        return self.notices.rendered(self.db.reader(), render)
+
+    def publish_notice(self, title: str, content: str, link: str = "") -> int:
+        notice_id = self.db.write(lambda write_conn: write_conn.execute(
+            "INSERT INTO notices (title, content, link, timestamp) VALUES (?, ?, ?, ?)",
+            (title, content, link, now_ist().strftime(TIMESTAMP_FORMAT))
+        ).lastrowid)
+        self.notices.bump()
+        return notice_id
+
+    def delete_notice(self, notice_id: int) -> None:
+        self.db.write(lambda write_conn: write_conn.execute(
+            "DELETE FROM notices WHERE id = ?",
+            (int(notice_id),)
+        ))
+        self.notices.bump()
+
+    # ---------------- EMAIL ----------------
+
+    def email_stats(self) -> dict:
+        return self.outbox.stats(self.db.reader())
@@ -0,0 +1,593 @@
+"""
+Batch and streaming exports.
+
+    python attendance_export.py csv --gzip                 # whole table
+    python attendance_export.py csv --subject "Mechanics (PHYS101TH)" -o -
+    python attendance_export.py parquet                    # needs pyarrow
+    python attendance_export.py term                       # every subject
+    python attendance_export.py term --layout summary --workers 4
+
+`csv` streams attendance records from one database cursor, in chunks,
+through an optional gzip stream to a file or stdout, so memory stays
+flat whatever the table size. The Faculty page uses the same writer
+(export_csv_file) when someone asks for a download.
+
+`parquet` archives attendance and sessions as Parquet under
+attendance_archive/ (ATTENDANCE_PARQUET), hive-partitioned by academic
+year, class and subject, with roll and status dictionary-encoded. Each
+run rewrites the partitions it finds in the live database and the
+retention archive (attendance_retention.py) and keeps the rest.
+The dashboard's multi-year analytics read it with partition and
+predicate pushdown (archive_yearly_summary, archive_monthly_trend).
+
+`term` writes each subject's PDF report, its raw records CSV and its
+student summary CSV into one ZIP under generated_reports/, grouped by
+class. The summaries for all subjects come from one grouped read
+(AttendanceService.term_summaries). PDFs are rendered in worker
+processes, each with its own read connections. Each PDF is written into
+the archive as soon as it is finished, while the main process streams
+the CSVs. A timing line is printed per subject.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import gzip
+import io
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+from typing import BinaryIO, Callable, Iterable, Optional
+
+import pandas as pd
+
+from attendance_core import (
+    ACADEMIC_YEAR_START_MONTH,
+    ATTENDANCE_RECORD_COLUMNS,
+    CLASS_SUBJECTS,
+    DB_PATH,
+    TIMESTAMP_FORMAT,
+    AttendanceService,
+    academic_year,
+    now_ist,
+)
+from attendance_reports import build_attendance_pdf, build_summary_pdf
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:  # only the Parquet archive needs it
+    pa = pc = ds = None
+
+EXPORT_DIR = "generated_reports"
+REPORT_LAYOUTS = ("detailed", "summary")
+PARQUET_ARCHIVE_DIR = os.environ.get("ATTENDANCE_PARQUET", "attendance_archive")
+PARQUET_PARTITIONS = ("academic_year", "class", "subject")
+PARQUET_CHUNK_ROWS = 50_000
+
+
+@dataclass(frozen=True)
+class SubjectExport:
+    student_class: str
+    subject: str
+    records: int
+    total_sessions: int
+    attendance_percent: float
+
+
+@dataclass(frozen=True)
+class SubjectTiming:
+    student_class: str
+    subject: str
+    records: int
+    pdf_seconds: float
+    csv_seconds: float
+
+
+def subject_classes() -> dict:
+    """subject -> class, first class wins for subjects listed twice."""
+    classes: dict = {}
+    for student_class, subjects in CLASS_SUBJECTS.items():
+        for subject in subjects:
+            classes.setdefault(subject, student_class)
+    return classes
+
+
+def _archive_path(export: SubjectExport, kind: str) -> str:
+    """<class>/<subject>/<subject> - <kind>, with path characters replaced."""
+    def clean(part: str) -> str:
+        return re.sub(r'[\\/:*?"<>|]+', "_", part).strip()
+
+    subject = clean(export.subject)
+    return f"{clean(export.student_class)}/{subject}/{subject} - {kind}"
+
+# ============================================================
+# STREAMING CSV
+# ============================================================
+
+@dataclass(frozen=True)
+class CSVExport:
+    path: str
+    rows: int
+    compressed: bool
+    include_archive: bool
+    created_at: datetime
+
+
+def write_attendance_csv(service: AttendanceService, out: BinaryIO,
+                         subject: Optional[str] = None,
+                         compress: bool = False,
+                         include_archive: bool = False) -> int:
+    """Stream records as CSV into ``out`` (left open); returns the row count.
+
+    ``include_archive`` adds the terms moved out by attendance_retention.
+    """
+    target = gzip.GzipFile(fileobj=out, mode="wb") if compress else out
+    text = io.TextIOWrapper(target, encoding="utf-8", newline="", write_through=True)
+    rows = 0
+
+    try:
+        writer = csv.writer(text)
+        writer.writerow(ATTENDANCE_RECORD_COLUMNS)
+        for chunk in service.iter_attendance_records(subject, include_archive=include_archive):
+            writer.writerows(chunk)
+            rows += len(chunk)
+    finally:
+        text.detach()
+        if compress:
+            target.close()
+
+    return rows
+
+
+def export_csv_file(service: AttendanceService, subject: Optional[str] = None,
+                    compress: bool = False, include_archive: bool = False,
+                    directory: Optional[str] = None) -> CSVExport:
+    """Write the export to a new temporary file; the caller removes it."""
+    suffix = ".csv.gz" if compress else ".csv"
+    fd, path = tempfile.mkstemp(prefix="attendance_", suffix=suffix, dir=directory)
+
+    try:
+        with os.fdopen(fd, "wb") as out:
+            rows = write_attendance_csv(service, out, subject, compress, include_archive)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    return CSVExport(path, rows, compress, include_archive, now_ist())
+
+# ============================================================
+# PARQUET ARCHIVE
+# ============================================================
+
+@dataclass(frozen=True)
+class ParquetExport:
+    root: str
+    attendance_rows: int
+    session_rows: int
+    seconds: float
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("The Parquet archive needs pyarrow: pip install pyarrow")
+
+
+def _partition_columns(subjects: tuple, days: tuple, classes: dict, years: dict) -> list:
+    for day in set(days):
+        if day not in years:
+            years[day] = academic_year(day)
+
+    return [
+        pa.array([years[day] for day in days], pa.string()),
+        pa.array([classes.get(subject, "Other") for subject in subjects], pa.string()),
+        pa.array(subjects, pa.string()),
+    ]
+
+
+def _attendance_batches(service: AttendanceService) -> tuple:
+    schema = pa.schema([
+        ("roll", pa.dictionary(pa.int32(), pa.string())),
+        ("name", pa.string()),
+        ("timestamp", pa.timestamp("s")),
+        ("day", pa.date32()),
+        ("token", pa.string()),
+        ("status", pa.dictionary(pa.int32(), pa.string())),
+    ] + [(name, pa.string()) for name in PARQUET_PARTITIONS])
+    classes, years = subject_classes(), {}
+    rows = [0]
+
+    def batches():
+        for chunk in service.iter_attendance_records(chunk_size=PARQUET_CHUNK_ROWS,
+                                                     include_archive=True):
+            roll, name, subject, timestamp, token, status, day = zip(*chunk)
+            rows[0] += len(chunk)
+
+            yield pa.RecordBatch.from_arrays([
+                pa.array(roll, pa.string()).dictionary_encode(),
+                pa.array(name, pa.string()),
+                pc.strptime(pa.array(timestamp, pa.string()), format=TIMESTAMP_FORMAT, unit="s"),
+                pc.cast(pc.strptime(pa.array(day, pa.string()), format="%Y-%m-%d", unit="s"), pa.date32()),
+                pa.array(token, pa.string()),
+                pa.array(status, pa.string()).dictionary_encode(),
+                *_partition_columns(subject, day, classes, years),
+            ], schema=schema)
+
+    return schema, batches(), rows
+
+
+def _session_batches(service: AttendanceService) -> tuple:
+    schema = pa.schema([
+        ("token", pa.string()),
+        ("expiry", pa.timestamp("s")),
+        ("day", pa.date32()),
+        ("capacity", pa.int32()),
+    ] + [(name, pa.string()) for name in PARQUET_PARTITIONS])
+    classes, years = subject_classes(), {}
+    rows = [0]
+
+    def batches():
+        for chunk in service.iter_session_records(chunk_size=PARQUET_CHUNK_ROWS,
+                                                  include_archive=True):
+            token, subject, expiry, capacity, day = zip(*chunk)
+            rows[0] += len(chunk)
+
+            yield pa.RecordBatch.from_arrays([
+                pa.array(token, pa.string()),
+                pc.strptime(pa.array(expiry, pa.string()), format=TIMESTAMP_FORMAT, unit="s"),
+                pc.cast(pc.strptime(pa.array(day, pa.string()), format="%Y-%m-%d", unit="s"), pa.date32()),
+                pa.array(capacity, pa.int32()),
+                *_partition_columns(subject, day, classes, years),
+            ], schema=schema)
+
+    return schema, batches(), rows
+
+
+def export_parquet(service: AttendanceService,
+                   root: str = PARQUET_ARCHIVE_DIR) -> ParquetExport:
+    """Write attendance/ and sessions/ datasets under ``root``.
+
+    Rows stream in chunks from the live database and the retention
+    archive; partitions written by this run are replaced, others are
+    left as they are.
+    """
+    _require_pyarrow()
+    started = time.perf_counter()
+    partitioning = ds.partitioning(
+        pa.schema([(name, pa.string()) for name in PARQUET_PARTITIONS]), flavor="hive"
+    )
+    counts = []
+
+    for table, source in (("attendance", _attendance_batches), ("sessions", _session_batches)):
+        schema, batches, rows = source(service)
+        ds.write_dataset(
+            batches,
+            os.path.join(root, table),
+            schema=schema,
+            format="parquet",
+            partitioning=partitioning,
+            basename_template="part-{i}.parquet",
+            existing_data_behavior="delete_matching",
+            min_rows_per_group=PARQUET_CHUNK_ROWS // 4,
+        )
+        counts.append(rows[0])
+
+    return ParquetExport(root, counts[0], counts[1], time.perf_counter() - started)
+
+
+def _open_archive(root: str, table: str):
+    _require_pyarrow()
+    path = os.path.join(root, table)
+    if not os.path.isdir(path):
+        return None
+    return ds.dataset(
+        path,
+        format="parquet",
+        partitioning=ds.HivePartitioning.discover(infer_dictionary=True)
+    )
+
+
+def archive_years(root: str = PARQUET_ARCHIVE_DIR) -> list:
+    """Academic years present in the archive, oldest first (no file reads)."""
+    path = os.path.join(root, "attendance")
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        entry.split("=", 1)[1] for entry in os.listdir(path)
+        if entry.startswith("academic_year=")
+    )
+
+
+def _archive_filter(academic_years: Optional[Iterable[str]] = None,
+                    student_class: Optional[str] = None,
+                    subject: Optional[str] = None):
+    conditions = []
+    if academic_years is not None:
+        conditions.append(ds.field("academic_year").isin(list(academic_years)))
+    if student_class:
+        conditions.append(ds.field("class") == student_class)
+    if subject:
+        conditions.append(ds.field("subject") == subject)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def archive_yearly_summary(root: str = PARQUET_ARCHIVE_DIR,
+                           academic_years: Optional[Iterable[str]] = None,
+                           student_class: Optional[str] = None,
+                           subject: Optional[str] = None) -> pd.DataFrame:
+    """One row per academic year: records by status, distinct students,
+    session days and present marks per session day.
+
+    Filters are pushed into the dataset scan, so only the matching
+    partitions and the few columns needed are read.
+    """
+    attendance = _open_archive(root, "attendance")
+    if attendance is None:
+        return pd.DataFrame()
+
+    academic_years = list(academic_years) if academic_years is not None else None
+    condition = _archive_filter(academic_years, student_class, subject)
+
+    # Each file carries its own dictionaries; grouping needs one per column
+    records = attendance.to_table(
+        columns=["academic_year", "roll", "status"], filter=condition
+    ).unify_dictionaries()
+    by_status = records.group_by(["academic_year", "status"]).aggregate(
+        [("roll", "count")]
+    ).to_pandas()
+    if by_status.empty:
+        return pd.DataFrame()
+
+    summary = by_status.pivot_table(
+        index="academic_year", columns="status", values="roll_count",
+        aggfunc="sum", fill_value=0, observed=True
+    )
+    summary.columns = [str(column) for column in summary.columns]
+
+    students = records.group_by(["academic_year"]).aggregate(
+        [("roll", "count_distinct")]
+    ).to_pandas().set_index("academic_year")["roll_count_distinct"]
+    summary["Students"] = students
+
+    sessions = _open_archive(root, "sessions")
+    if sessions is not None:
+        session_days = sessions.to_table(
+            columns=["academic_year", "subject", "day"], filter=condition
+        ).group_by(["academic_year", "subject"]).aggregate(
+            [("day", "count_distinct")]
+        ).to_pandas().groupby("academic_year", observed=True)["day_count_distinct"].sum()
+
+        summary["Session_Days"] = session_days
+        summary["Session_Days"] = summary["Session_Days"].fillna(0).astype(int)
+        if "Present" in summary:
+            summary["Present_per_Session"] = (
+                summary["Present"] / summary["Session_Days"].where(summary["Session_Days"] > 0)
+            ).round(2)
+
+    summary.index = summary.index.astype(str)
+    return summary.reset_index().sort_values("academic_year", ignore_index=True)
+
+
+def archive_monthly_trend(root: str = PARQUET_ARCHIVE_DIR,
+                          academic_years: Optional[Iterable[str]] = None,
+                          student_class: Optional[str] = None,
+                          subject: Optional[str] = None) -> pd.DataFrame:
+    """Present marks per month of the academic year, one line per year."""
+    attendance = _open_archive(root, "attendance")
+    if attendance is None:
+        return pd.DataFrame()
+
+    condition = _archive_filter(academic_years, student_class, subject)
+    status_present = ds.field("status") == "Present"
+    condition = status_present if condition is None else condition & status_present
+
+    per_day = attendance.to_table(
+        columns=["academic_year", "day"], filter=condition
+    ).unify_dictionaries().group_by(["academic_year", "day"]).aggregate([("day", "count")]).to_pandas()
+    if per_day.empty:
+        return pd.DataFrame()
+
+    days = pd.to_datetime(per_day["day"])
+    per_day["academic_year"] = per_day["academic_year"].astype(str)
+    per_day["Month"] = days.dt.strftime("%b")
+    per_day["Month_No"] = (days.dt.month - ACADEMIC_YEAR_START_MONTH) % 12
+
+    return (
+        per_day.groupby(["academic_year", "Month_No", "Month"], as_index=False)["day_count"]
+        .sum()
+        .rename(columns={"day_count": "Present"})
+        .sort_values(["academic_year", "Month_No"], ignore_index=True)
+    )
+
+# ============================================================
+# PDF WORKERS (ONE SERVICE PER PROCESS)
+# ============================================================
+
+_worker_service: Optional[AttendanceService] = None
+
+
+def _init_worker(db_path: str) -> None:
+    global _worker_service
+    _worker_service = AttendanceService(db_path, read_only=True)
+
+
+def _render_pdf(export: SubjectExport, layout: str) -> tuple:
+    started = time.perf_counter()
+
+    if layout == "summary":
+        data = build_summary_pdf(_worker_service, export.student_class, export.subject)
+    else:
+        data = build_attendance_pdf(
+            _worker_service, export.student_class, export.subject,
+            export.total_sessions, export.attendance_percent
+        )
+    return data, time.perf_counter() - started
+
+# ============================================================
+# TERM EXPORT
+# ============================================================
+
+def export_term(service: AttendanceService, output: str,
+                layout: str = "detailed", workers: Optional[int] = None,
+                log: Callable[[str], None] = print) -> list:
+    """Write every subject with records into the ZIP at ``output``."""
+    started = time.perf_counter()
+    totals, summaries = service.term_summaries()
+    classes = subject_classes()
+
+    exports = [
+        SubjectExport(
+            classes.get(row.subject, "Other"),
+            row.subject,
+            int(row.records),
+            int(row.Total_Classes),
+            round(row.records / row.Total_Classes, 2) if row.Total_Classes else 0
+        )
+        for row in totals.itertuples(index=False)
+    ]
+    log(f"{len(exports)} subjects, summaries read in {time.perf_counter() - started:.2f}s")
+
+    if not exports:
+        return []
+
+    timings = []
+    csv_seconds: dict = {}
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers or os.cpu_count() or 1, len(exports)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(service.db.db_path,)
+    ) as pool, zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+
+        pending = {pool.submit(_render_pdf, export, layout): export for export in exports}
+
+        def store_pdf(future: Future) -> None:
+            export = pending.pop(future)
+            data, pdf_seconds = future.result()
+            archive.writestr(_archive_path(export, "report.pdf"), data)
+
+            timing = SubjectTiming(
+                export.student_class, export.subject, export.records,
+                pdf_seconds, csv_seconds[export.subject]
+            )
+            timings.append(timing)
+            log(
+                f"{timing.student_class:<7} {timing.subject:<52} "
+                f"{timing.records:>8} rows  pdf {timing.pdf_seconds:6.2f}s  "
+                f"csv {timing.csv_seconds:5.2f}s"
+            )
+
+        # CSVs are written here while the workers render the PDFs
+        for export in exports:
+            csv_started = time.perf_counter()
+            with archive.open(_archive_path(export, "records.csv"), "w") as out:
+                write_attendance_csv(service, out, export.subject)
+            archive.writestr(
+                _archive_path(export, "summary.csv"),
+                summaries[summaries["subject"] == export.subject].to_csv(index=False)
+            )
+            csv_seconds[export.subject] = time.perf_counter() - csv_started
+
+            # A later subject's PDF can finish before its CSV is written
+            for future in [
+                future for future, done_export in pending.items()
+                if future.done() and done_export.subject in csv_seconds
+            ]:
+                store_pdf(future)
+
+        for future in as_completed(list(pending)):
+            store_pdf(future)
+
+    log(f"Wrote {output} in {time.perf_counter() - started:.2f}s")
+    return timings
+
+# ============================================================
+# ENTRY POINT
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export attendance reports in bulk")
+    parser.add_argument("--db", default=DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    csv_export = commands.add_parser("csv", help="attendance records as (gzipped) CSV")
+    csv_export.add_argument("--subject", help="one subject only (default: all)")
+    csv_export.add_argument("--gzip", action="store_true")
+    csv_export.add_argument("--include-archive", action="store_true",
+                            help="also export terms moved out by attendance_retention.py")
+    csv_export.add_argument("-o", "--output",
+                            help="file path or - for stdout "
+                                 "(default: generated_reports/attendance_<date>.csv[.gz])")
+
+    parquet = commands.add_parser("parquet", help="partitioned Parquet archive (needs pyarrow)")
+    parquet.add_argument("--root", default=PARQUET_ARCHIVE_DIR)
+
+    term = commands.add_parser("term", help="every subject's PDF and CSVs in one ZIP")
+    term.add_argument("--output", help="ZIP path (default: generated_reports/term_<date>.zip)")
+    term.add_argument("--layout", choices=REPORT_LAYOUTS, default="detailed")
+    term.add_argument("--workers", type=int, default=None,
+                      help="PDF worker processes (default: CPU count)")
+
+    args = parser.parse_args(argv)
+    service = AttendanceService(args.db, read_only=True)
+
+    if args.command == "csv":
+        started = time.perf_counter()
+        output = args.output
+        if not output:
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            output = os.path.join(
+                EXPORT_DIR,
+                f"attendance_{now_ist():%Y-%m-%d_%H%M}.csv" + (".gz" if args.gzip else "")
+            )
+
+        if output == "-":
+            rows = write_attendance_csv(service, sys.stdout.buffer, args.subject,
+                                        args.gzip, args.include_archive)
+            sys.stdout.buffer.flush()
+        else:
+            with open(output, "wb") as out:
+                rows = write_attendance_csv(service, out, args.subject,
+                                            args.gzip, args.include_archive)
+
+        print(f"Wrote {rows} rows to {output} in {time.perf_counter() - started:.2f}s",
+              file=sys.stderr)
+
+    elif args.command == "parquet":
+        try:
+            result = export_parquet(service, args.root)
+        except RuntimeError as exc:
+            raise SystemExit(str(exc))
+        print(
+            f"Archived {result.attendance_rows} attendance and {result.session_rows} "
+            f"session rows to {result.root} in {result.seconds:.2f}s"
+        )
+
+    elif args.command == "term":
+        output = args.output
+        if not output:
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            output = os.path.join(EXPORT_DIR, f"term_{now_ist():%Y-%m-%d_%H%M}.zip")
+        export_term(service, output, args.layout, args.workers)
+
+
+if __name__ == "__main__":
+    main()
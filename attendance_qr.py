@@ -0,0 +1,117 @@
+"""
+QR code rendering with an in-memory cache.
+
+Encoding a QR and writing it out as an image costs far more than
+everything else on the faculty QR screen, and the same payload is drawn
+again on every rerun. QRRenderCache keeps the encoded PNG / SVG bytes
+keyed by (payload, format, box size, border) with LRU eviction, and can
+render upcoming payloads (the next rotation frames of a signed QR) on a
+background thread so they are ready before they are shown.
+"""
+
+from __future__ import annotations
+
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable
+
+import qrcode
+import qrcode.image.svg
+
+QR_CACHE_MAX_ENTRIES = 64
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+QR_FORMATS = ("png", "svg")
+
+
+def render_qr(payload: str, fmt: str = "png", box_size: int = QR_BOX_SIZE,
+              border: int = QR_BORDER) -> bytes:
+    if fmt not in QR_FORMATS:
+        raise ValueError(f"Unsupported QR format: {fmt!r}")
+
+    qr = qrcode.QRCode(box_size=box_size, border=border)
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    buf = io.BytesIO()
+    if fmt == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buf)
+    else:
+        qr.make_image().save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class QRRenderCache:
+    """Process-wide LRU of rendered QR images.
+
+    A render already in flight (e.g. a prefetch) is awaited rather than
+    repeated, so each payload is encoded at most once while cached.
+    """
+
+    def __init__(self, max_entries: int = QR_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._images: OrderedDict = OrderedDict()
+        self._pending: dict = {}
+        self._lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qr-prefetch")
+
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, payload: str, fmt: str = "png", box_size: int = QR_BOX_SIZE,
+               border: int = QR_BORDER) -> bytes:
+        key = (payload, fmt, box_size, border)
+
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+
+            self.misses += 1
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return pending.result()
+
+        return self._render_into_cache(key, pending)
+
+    def prefetch(self, payloads: Iterable[str], fmt: str = "png",
+                 box_size: int = QR_BOX_SIZE, border: int = QR_BORDER) -> None:
+        """Render payloads that are not cached yet on the background thread."""
+        for payload in payloads:
+            key = (payload, fmt, box_size, border)
+
+            with self._lock:
+                if key in self._images or key in self._pending:
+                    continue
+                pending = self._pending[key] = Future()
+
+            self._prefetcher.submit(self._render_into_cache, key, pending)
+
+    def _render_into_cache(self, key: tuple, pending: Future) -> bytes:
+        try:
+            image = render_qr(*key)
+        except BaseException as exc:
+            with self._lock:
+                del self._pending[key]
+            pending.set_exception(exc)
+            raise
+
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+            del self._pending[key]
+
+        pending.set_result(image)
+        return image
@@ -0,0 +1,301 @@
+"""
+PDF attendance reports, built on demand in the background.
+
+Two layouts, both streamed from the database in keyset chunks so memory
+stays bounded however long the history is:
+
+  build_attendance_pdf  every record, newest first, as split-capable
+                        tables with the header repeated on each page
+  build_summary_pdf     one row per student (counts, %, fine) plus a
+                        compact P / L / A register per month (landscape)
+
+ReportBuilder runs those builds on a worker thread, one at a time, and
+keeps the finished bytes per report key together with the data version
+they were built from, so the Faculty page only pays ReportLab's cost
+when someone asks for a report and the data has changed.
+"""
+
+from __future__ import annotations
+
+import io
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import groupby
+from typing import Callable, Iterable, Iterator, Optional
+
+from reportlab.lib import colors, pagesizes
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import LongTable, Paragraph, SimpleDocTemplate, Spacer, TableStyle
+
+from attendance_core import (
+    ATTENDANCE_RECORD_COLUMNS,
+    FINE_PER_ABSENT_DAY,
+    LEAVE_STATUS,
+    AttendanceService,
+    now_ist,
+)
+
+REPORT_CACHE_MAX_REPORTS = 16
+STATUS_MARKS = {"Present": "P", LEAVE_STATUS: "L", "Absent": "A"}
+SUMMARY_COLUMNS = ["Roll", "Name", "Present", "Leave", "Absent", "Attendance %", "Fine (₹)"]
+
+ProgressCallback = Callable[[float], None]
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.green),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+])
+
+GRID_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.green),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTSIZE', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 1),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+    ('LEFTPADDING', (0, 0), (-1, -1), 1),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 1),
+])
+
+# ============================================================
+# STREAMED STORY
+# ============================================================
+# ReportLab consumes the story from the front (len / [0] / del [0]).
+# This list refills itself from a generator whenever it runs dry, so
+# only the flowables for the current chunk of rows exist at any time.
+
+class _StreamedStory(list):
+
+    def __init__(self, flowables: Iterable):
+        super().__init__()
+        self._pending: Iterator = iter(flowables)
+
+    def __len__(self):
+        if not super().__len__():
+            for flowable in self._pending:
+                self.append(flowable)
+                break
+        return super().__len__()
+
+
+def _report_header(title: str, details: list) -> list:
+    styles = getSampleStyleSheet()
+
+    # University Header
+    elements = [
+        Paragraph("<b>G. B. Pant Memorial Govt. College</b>", styles['Title']),
+        Paragraph("Rampur Bushahr, Shimla", styles['Normal']),
+        Spacer(1, 0.2 * inch),
+        Paragraph(f"<b>{title}</b>", styles['Heading2']),
+        Spacer(1, 0.2 * inch),
+    ]
+
+    # Report Details
+    for detail in details + [f"Generated On: {now_ist().strftime('%d-%m-%Y %H:%M')}"]:
+        elements.append(Paragraph(detail, styles['Normal']))
+
+    elements.append(Spacer(1, 0.3 * inch))
+    return elements
+
+
+def _build(story: Iterable, pagesize) -> bytes:
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=pagesize)
+    doc.build(_StreamedStory(story))
+    return buffer.getvalue()
+
+# ============================================================
+# DETAILED RECORDS REPORT
+# ============================================================
+
+def build_attendance_pdf(service: AttendanceService, selected_class: str,
+                         subject: str, total_sessions: int,
+                         attendance_percent: float,
+                         progress: Optional[ProgressCallback] = None) -> bytes:
+    progress = progress or (lambda fraction: None)
+    total_rows = max(service.subject_attendance_totals(subject)[0], 1)
+
+    def story():
+        yield from _report_header("Attendance Report", [
+            f"Class: {selected_class}",
+            f"Subject: {subject}",
+            f"Total Sessions: {total_sessions}",
+            f"Attendance Percentage: {attendance_percent}%",
+        ])
+
+        done = 0
+        for chunk in service.iter_subject_attendance(subject):
+            yield LongTable(
+                [list(ATTENDANCE_RECORD_COLUMNS)] + [list(row) for row in chunk],
+                repeatRows=1,
+                style=TABLE_STYLE
+            )
+            done += len(chunk)
+            progress(min(done / total_rows, 1.0) * 0.95)
+
+    data = _build(story(), pagesizes.A4)
+    progress(1.0)
+    return data
+
+# ============================================================
+# STUDENT SUMMARY + DAILY GRID REPORT
+# ============================================================
+
+def _percent(present: int, leave: int, total_classes: int) -> str:
+    countable = total_classes - leave
+    return f"{present / countable * 100:.2f}" if countable > 0 else "–"
+
+
+def build_summary_pdf(service: AttendanceService, selected_class: str,
+                      subject: str,
+                      progress: Optional[ProgressCallback] = None) -> bytes:
+    progress = progress or (lambda fraction: None)
+
+    total_classes = service.subject_session_days(subject)
+    days = service.attendance_days(subject)
+    months = [
+        (month, list(month_days))
+        for month, month_days in groupby(days, key=lambda day: day[:7])
+    ]
+    passes = 1 + len(months)
+
+    def story():
+        styles = getSampleStyleSheet()
+
+        yield from _report_header("Attendance Summary", [
+            f"Class: {selected_class}",
+            f"Subject: {subject}",
+            f"Total Sessions: {total_classes}",
+            "Register marks: P = Present, L = Leave, A = Absent, · = no record",
+        ])
+
+        yield Paragraph("<b>Per-Student Summary</b>", styles['Heading3'])
+        for chunk in service.iter_student_days(subject):
+            rows = [
+                [
+                    student.roll,
+                    student.name,
+                    student.present,
+                    student.leave,
+                    student.absent,
+                    _percent(student.present, student.leave, total_classes),
+                    max(total_classes - student.present - student.leave, 0) * FINE_PER_ABSENT_DAY,
+                ]
+                for student in chunk
+            ]
+            yield LongTable([SUMMARY_COLUMNS] + rows, repeatRows=1, style=TABLE_STYLE)
+        progress(0.95 / passes)
+
+        for done, (month, month_days) in enumerate(months, start=2):
+            yield Spacer(1, 0.2 * inch)
+            yield Paragraph(f"<b>Daily Register – {month}</b>", styles['Heading3'])
+
+            header = ["Roll"] + [day[8:] for day in month_days]
+            col_widths = [0.9 * inch] + [0.28 * inch] * len(month_days)
+
+            for chunk in service.iter_student_days(subject, month_days[0], month_days[-1]):
+                rows = [
+                    [student.roll] + [
+                        STATUS_MARKS.get(student.statuses.get(day), "·")
+                        for day in month_days
+                    ]
+                    for student in chunk
+                ]
+                yield LongTable(
+                    [header] + rows,
+                    colWidths=col_widths,
+                    repeatRows=1,
+                    style=GRID_STYLE
+                )
+            progress(0.95 * done / passes)
+
+    data = _build(story(), pagesizes.landscape(pagesizes.A4))
+    progress(1.0)
+    return data
+
+# ============================================================
+# BACKGROUND REPORT BUILDER
+# ============================================================
+
+@dataclass
+class ReportJob:
+    version: object
+    started_at: float = field(default_factory=time.monotonic)
+    progress: float = 0.0
+    future: Future = field(default_factory=Future)
+
+    @property
+    def error(self) -> Optional[BaseException]:
+        return self.future.exception() if self.future.done() else None
+
+
+@dataclass(frozen=True)
+class Report:
+    data: bytes
+    version: object
+    built_at: datetime
+
+
+class ReportBuilder:
+    """Process-wide; builds one report at a time and keeps the latest ones."""
+
+    def __init__(self, max_reports: int = REPORT_CACHE_MAX_REPORTS):
+        self.max_reports = max_reports
+        self._lock = threading.Lock()
+        self._jobs: dict = {}
+        self._reports: OrderedDict = OrderedDict()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-builder")
+
+    def submit(self, key, version,
+               build: Callable[[ProgressCallback], bytes]) -> ReportJob:
+        """Queue a build unless one for ``key`` is already running."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.future.done():
+                return job
+
+            job = self._jobs[key] = ReportJob(version)
+
+        self._worker.submit(self._run, key, job, build)
+        return job
+
+    def job(self, key) -> Optional[ReportJob]:
+        """The running (or failed) build for ``key``; None once it succeeded."""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def latest(self, key) -> Optional[Report]:
+        with self._lock:
+            report = self._reports.get(key)
+            if report is not None:
+                self._reports.move_to_end(key)
+            return report
+
+    def _run(self, key, job: ReportJob,
+             build: Callable[[ProgressCallback], bytes]) -> None:
+        def progress(fraction: float) -> None:
+            job.progress = fraction
+
+        try:
+            data = build(progress)
+        except BaseException as exc:
+            job.future.set_exception(exc)
+            return
+
+        with self._lock:
+            self._reports[key] = Report(data, job.version, now_ist())
+            self._reports.move_to_end(key)
+            while len(self._reports) > self.max_reports:
+                self._reports.popitem(last=False)
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+
+        job.future.set_result(data)
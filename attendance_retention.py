@@ -0,0 +1,325 @@
+"""
+Term archival and retention for attendance.db.
+
+    python attendance_retention.py                      # archive closed terms
+    python attendance_retention.py --dry-run
+    python attendance_retention.py --before 2026-01-01
+
+Keeps the live database down to the current term, so the hot queries
+(the active session lookup, day lookups, subject pages and summaries)
+stop slowing down every semester. Attendance and sessions from before
+the current term (term_start) move into attendance_archive.db
+(ATTENDANCE_ARCHIVE_DB):
+
+1. A full online backup of the live database is taken first
+   (attendance_backup), so the app keeps working while it runs.
+2. The archive is ATTACHed and rows move in batches per subject: each
+   batch is copied with INSERT OR IGNORE and committed, then deleted from
+   the live table only where the archived copy exists. With WAL a
+   transaction spanning two files is not atomic across them, so this
+   order means a crash can leave a row in both places (the next run
+   finishes it) but never in neither.
+3. Freed pages are handed back with PRAGMA incremental_vacuum in small
+   steps. Databases created before auto_vacuum=INCREMENTAL need one full
+   VACUUM first (--enable-incremental-vacuum).
+
+The trigger-maintained summaries follow the deletes, so the dashboard's
+counts and percentages cover the current term. Archived rows stay
+reachable: AttendanceService attaches the archive read-only for
+iter_attendance_records(include_archive=True), which the CSV export and
+the Parquet archive use.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Optional
+
+from attendance_core import (
+    ARCHIVE_DB_PATH,
+    DB_PATH,
+    migrate_database,
+    now_ist,
+    open_connection,
+    term_start,
+)
+from attendance_backup import BACKUP_DIR, backup_database
+
+RETENTION_BATCH_ROWS = 5000
+VACUUM_PAGES_PER_STEP = 512
+VACUUM_STEP_SLEEP_SECONDS = 0.01
+
+ARCHIVE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS archive.attendance (
+        roll TEXT,
+        name TEXT,
+        subject TEXT,
+        timestamp TEXT,
+        token TEXT,
+        status TEXT,
+        day TEXT GENERATED ALWAYS AS (substr(timestamp, 1, 10)) VIRTUAL
+    )
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS archive.uq_archive_attendance_roll_subject_day
+    ON attendance (roll, subject, day)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS archive.idx_archive_attendance_subject_day
+    ON attendance (subject, day)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archive.sessions (
+        token TEXT PRIMARY KEY,
+        subject TEXT,
+        expiry TEXT,
+        capacity INTEGER,
+        day TEXT GENERATED ALWAYS AS (substr(expiry, 1, 10)) VIRTUAL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS archive.idx_archive_sessions_subject_day
+    ON sessions (subject, day)
+    """,
+)
+
+
+@dataclass(frozen=True)
+class RetentionResult:
+    cutoff: date
+    attendance_rows: int
+    session_rows: int
+    conflicts: dict     # table -> rowids kept live (the archive holds them differently)
+    snapshot_path: Optional[str]
+    freed_pages: int
+    seconds: float
+
+
+def _move_batches(conn: sqlite3.Connection, table: str, columns: str,
+                  match: str, cutoff: str, batch_rows: int) -> tuple:
+    """Move rows of ``table`` with day < cutoff, subject by subject.
+
+    Returns (rows moved, rowids kept live because the archive already
+    holds them differently); the kept rows are skipped for the rest of
+    the run so they cannot stall it.
+    """
+    subjects = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT subject FROM main.{table} WHERE day < ?", (cutoff,)
+    )]
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS retention_kept (row_id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.retention_kept")
+    moved = 0
+
+    for subject in subjects:
+        while True:
+            rowids = [row[0] for row in conn.execute(
+                f"""SELECT rowid FROM main.{table}
+                    WHERE subject IS ? AND day < ?
+                      AND rowid NOT IN (SELECT row_id FROM temp.retention_kept)
+                    LIMIT ?""",
+                (subject, cutoff, batch_rows)
+            )]
+            if not rowids:
+                break
+            batch = f"rowid IN ({','.join('?' * len(rowids))})"
+
+            # 1. copy into the archive and commit it there
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    f"""INSERT OR IGNORE INTO archive.{table} ({columns})
+                        SELECT {columns} FROM main.{table} WHERE {batch}""",
+                    rowids
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+            # 2. delete from the live table what the archive now holds
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = conn.execute(
+                    f"""DELETE FROM main.{table}
+                        WHERE {batch}
+                          AND EXISTS (SELECT 1 FROM archive.{table} a WHERE {match})""",
+                    rowids
+                ).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+            moved += deleted
+            if deleted < len(rowids):
+                # Rows the archive already held differently; leave them live
+                conn.execute(
+                    f"""INSERT INTO temp.retention_kept
+                        SELECT rowid FROM main.{table} WHERE {batch}""",
+                    rowids
+                )
+
+    kept = tuple(row[0] for row in conn.execute("SELECT row_id FROM temp.retention_kept"))
+    return moved, kept
+
+
+def incremental_vacuum(conn: sqlite3.Connection,
+                       pages_per_step: int = VACUUM_PAGES_PER_STEP) -> int:
+    """Release free pages a few at a time; returns how many were freed."""
+    if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != 2:
+        return 0
+
+    initial = free = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+    while free:
+        # The pragma frees one page per VDBE step and returns no columns,
+        # so execute() would stop after the first; executescript runs it out
+        conn.executescript(f"PRAGMA main.incremental_vacuum({pages_per_step});")
+        remaining = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+        if remaining >= free:
+            break
+        free = remaining
+        time.sleep(VACUUM_STEP_SLEEP_SECONDS)
+
+    return initial - free
+
+
+def archive_closed_terms(db_path: str = DB_PATH,
+                         archive_path: str = ARCHIVE_DB_PATH,
+                         cutoff: Optional[date] = None,
+                         backup_dir: Optional[str] = BACKUP_DIR,
+                         batch_rows: int = RETENTION_BATCH_ROWS,
+                         log: Callable[[str], None] = print) -> RetentionResult:
+    """Move attendance and sessions dated before ``cutoff`` (default: the
+    start of the current term) into the archive database."""
+    started = time.perf_counter()
+    cutoff = cutoff or term_start(now_ist().date())
+    migrate_database(db_path)
+
+    snapshot_path = None
+    if backup_dir:
+        snapshot_path = backup_database(db_path, backup_dir, full=True).manifest_path
+        log(f"Full backup written to {snapshot_path}")
+
+    conn = open_connection(db_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+        conn.execute("PRAGMA archive.journal_mode=WAL")
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement)
+
+        attendance_rows, kept_attendance = _move_batches(
+            conn, "attendance", "roll, name, subject, timestamp, token, status",
+            "a.roll = attendance.roll AND a.subject = attendance.subject "
+            "AND a.day = attendance.day AND a.token IS attendance.token",
+            cutoff.isoformat(), batch_rows
+        )
+        session_rows, kept_sessions = _move_batches(
+            conn, "sessions", "token, subject, expiry, capacity",
+            "a.token = sessions.token",
+            cutoff.isoformat(), batch_rows
+        )
+
+        # Students with nothing left in the current term
+        conn.execute("""
+            DELETE FROM main.student_subject_summary
+            WHERE present_days = 0 AND leave_days = 0 AND absent_days = 0
+        """)
+
+        conn.execute("DETACH DATABASE archive")
+        freed_pages = incremental_vacuum(conn)
+        if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != 2:
+            log("auto_vacuum is off for this database: run once with "
+                "--enable-incremental-vacuum to release freed space")
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    finally:
+        conn.close()
+
+    conflicts = {
+        table: kept
+        for table, kept in (("attendance", kept_attendance), ("sessions", kept_sessions))
+        if kept
+    }
+    result = RetentionResult(
+        cutoff, attendance_rows, session_rows, conflicts, snapshot_path, freed_pages,
+        time.perf_counter() - started
+    )
+    log(
+        f"Archived {result.attendance_rows} attendance and {result.session_rows} session "
+        f"rows before {result.cutoff} to {archive_path}, freed {result.freed_pages} pages "
+        f"in {result.seconds:.2f}s"
+    )
+    for table, kept in result.conflicts.items():
+        log(
+            f"Kept {len(kept)} {table} rows live: the archive already holds them with "
+            f"different values (rowids {', '.join(map(str, kept[:20]))}"
+            f"{', …' if len(kept) > 20 else ''})"
+        )
+    return result
+
+
+def enable_incremental_vacuum(db_path: str = DB_PATH) -> None:
+    """One-off full VACUUM that switches an existing file to
+    auto_vacuum=INCREMENTAL. Run it with the app stopped: VACUUM cannot
+    change auto_vacuum in WAL mode, so the file leaves WAL meanwhile."""
+    conn = open_connection(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    finally:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+
+# ============================================================
+# ENTRY POINT
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move closed terms into the archive database")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--archive", default=ARCHIVE_DB_PATH)
+    parser.add_argument("--before", type=date.fromisoformat,
+                        help="archive rows dated before this day (default: start of the current term)")
+    parser.add_argument("--backup-dir", default=BACKUP_DIR)
+    parser.add_argument("--no-snapshot", action="store_true")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would move")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="switch an existing database to incremental vacuum (full VACUUM once)")
+    args = parser.parse_args(argv)
+
+    cutoff = args.before or term_start(now_ist().date())
+
+    if args.dry_run:
+        migrate_database(args.db)
+        conn = open_connection(args.db, read_only=True)
+        try:
+            counts = [
+                conn.execute(f"SELECT COUNT(*) FROM {table} WHERE day < ?",
+                             (cutoff.isoformat(),)).fetchone()[0]
+                for table in ("attendance", "sessions")
+            ]
+        finally:
+            conn.close()
+        print(f"Would archive {counts[0]} attendance and {counts[1]} session rows before {cutoff}")
+        return
+
+    if args.enable_incremental_vacuum:
+        try:
+            enable_incremental_vacuum(args.db)
+        except sqlite3.OperationalError as exc:
+            raise SystemExit(f"Could not switch to incremental vacuum ({exc}); stop the app first")
+        print("auto_vacuum=INCREMENTAL enabled")
+
+    archive_closed_terms(
+        args.db, args.archive, cutoff,
+        None if args.no_snapshot else args.backup_dir
+    )
+
+
+if __name__ == "__main__":
+    main()
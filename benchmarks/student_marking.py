@@ -0,0 +1,502 @@
+"""
+Load test for the Student marking flow of attendance_app.py.
+
+Two modes, both against a throw-away database with SMTP replaced by an
+in-memory stub so confirmation emails are delivered without a network:
+
+  service  N simulated students hit attendance_core.AttendanceService
+           from a thread pool at the same time: session lookup, pass-key
+           check, registration check, mark, counter read.
+  api      Same flow over HTTP against attendance_api.py, served by
+           uvicorn in a background thread (needs uvicorn): load the
+           session, POST /api/mark, and again with registration details
+           when the roll is new. One keep-alive connection per student
+           thread.
+  app      Drives the real Streamlit script headlessly with AppTest: each
+           student picks the Student portal, enters roll and pass key and
+           presses Mark (or Register & Mark). AppTest keeps one Runtime per
+           process, so students run one after another.
+
+    python benchmarks/student_marking.py --students 100 --concurrency 50
+    python benchmarks/student_marking.py --mode api --students 500
+    python benchmarks/student_marking.py --mode app --students 20
+
+Reports p50/p95/p99 latency for the whole flow and for the final click,
+throughput, outcome counts, lock-timeout counts and the DB / WAL sizes.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import smtplib
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "attendance_app.py")
+SUBJECT = "Mechanics (PHYS101TH)"
+PASS_KEY = "BENCHMARK-PASS-KEY"
+
+if REPO_ROOT not in sys.path:
+    # `streamlit run` puts the script's folder on sys.path; AppTest does not
+    sys.path.insert(0, REPO_ROOT)
+
+SECRETS = {
+    "EMAIL_ADDRESS": "bench@example.com",
+    "EMAIL_PASSWORD": "bench",
+    "FACULTY_USERS": {"bench": "bench"},
+}
+
+
+# ============================================================
+# IN-MEMORY SMTP STUB
+# ============================================================
+
+class InMemorySMTP:
+    delivered = []
+    connections = 0
+    _lock = threading.Lock()
+
+    def __init__(self, host=None, port=None, timeout=None):
+        with InMemorySMTP._lock:
+            InMemorySMTP.connections += 1
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg):
+        with InMemorySMTP._lock:
+            InMemorySMTP.delivered.append(msg["To"])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# ============================================================
+# SIMULATED STUDENT
+# ============================================================
+
+def now_ist():
+    return datetime.utcnow() + timedelta(hours=5, minutes=30)
+
+
+def _by_label(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+def simulate_student(roll, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    started = time.perf_counter()
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.secrets.update(SECRETS)
+
+    at.run()
+    at.sidebar.radio[0].set_value("Student").run()
+    _by_label(at.text_input, "Enter Your Roll Number").input(roll).run()
+    _by_label(at.text_input, "Pass Key").input(PASS_KEY).run()
+
+    if any("Attendance Closed" in e.value for e in at.error):
+        # The live counter already closed the page; there is nothing to click
+        finished = time.perf_counter()
+        return {
+            "roll": roll,
+            "outcome": "full",
+            "flow_seconds": finished - started,
+            "click_seconds": None,
+            "messages": [e.value for e in at.error],
+        }
+
+    labels = [b.label for b in at.button]
+    if "Register & Mark Attendance" in labels:
+        _by_label(at.text_input, "Full Name").input(f"Student {roll}")
+        _by_label(at.text_input, "Gmail Address").input(f"{roll.lower()}@example.com")
+        _by_label(at.text_input, "Mobile Number").input("9999999999")
+        button = _by_label(at.button, "Register & Mark Attendance")
+    else:
+        button = _by_label(at.button, "Mark Attendance")
+
+    click_started = time.perf_counter()
+    button.click().run()
+    finished = time.perf_counter()
+
+    errors = [e.value for e in at.error]
+    warnings = [w.value for w in at.warning]
+    exceptions = [e.message for e in at.exception]
+
+    # AppTest replays the click on the st.rerun() after a successful mark,
+    # so the page can end on "already marked"; the row is the ground truth
+    if exceptions:
+        outcome = "exception"
+    elif is_marked(roll):
+        outcome = "marked"
+    elif any("Attendance Closed" in e for e in errors):
+        outcome = "full"
+    elif any("already marked" in w for w in warnings):
+        outcome = "already_marked"
+    else:
+        outcome = "error"
+
+    return {
+        "roll": roll,
+        "outcome": outcome,
+        "flow_seconds": finished - started,
+        "click_seconds": finished - click_started,
+        "messages": errors + warnings + exceptions,
+    }
+
+
+def is_marked(roll):
+    check_conn = sqlite3.connect(os.environ["ATTENDANCE_DB"], timeout=30)
+    try:
+        return check_conn.execute(
+            "SELECT 1 FROM attendance WHERE roll=? AND token=?",
+            (roll, PASS_KEY)
+        ).fetchone() is not None
+    finally:
+        check_conn.close()
+
+
+def simulate_service_student(service, roll):
+    from attendance_core import Student
+
+    started = time.perf_counter()
+    session = service.validate_pass_key(PASS_KEY)
+    if session is None:
+        return {
+            "roll": roll,
+            "outcome": "error",
+            "flow_seconds": time.perf_counter() - started,
+            "click_seconds": None,
+            "messages": ["Invalid Pass Key"],
+        }
+
+    if service.marked_count(session.token) >= session.capacity:
+        outcome = "full"
+        click_started = time.perf_counter()
+    else:
+        registered = service.find_student(roll, session.subject)
+        registration = None
+        if registered is None:
+            registration = Student(
+                roll, f"Student {roll}", "B.Sc 1",
+                f"{roll.lower()}@example.com", "9999999999", session.subject
+            )
+            registered = registration
+
+        click_started = time.perf_counter()
+        outcome = service.mark_attendance(
+            roll, registered.name, session.subject, session.token,
+            registered.gmail, registration
+        )
+        service.marked_count(session.token)
+
+    finished = time.perf_counter()
+    return {
+        "roll": roll,
+        "outcome": outcome,
+        "flow_seconds": finished - started,
+        "click_seconds": finished - click_started,
+        "messages": [],
+    }
+
+
+_api_connections = threading.local()
+
+
+def api_request(port, method, path, payload=None, retry=True):
+    conn = getattr(_api_connections, "conn", None)
+    if conn is None:
+        conn = _api_connections.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+
+    body = json.dumps(payload).encode() if payload is not None else None
+    try:
+        conn.request(method, path, body, {"content-type": "application/json"})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    except (http.client.HTTPException, OSError):
+        conn.close()
+        _api_connections.conn = None
+        if not retry:
+            raise
+        # The server closes idle keep-alive connections; reconnect once
+        return api_request(port, method, path, payload, retry=False)
+
+
+def simulate_api_student(port, roll):
+    started = time.perf_counter()
+    status, session = api_request(port, "GET", "/api/session")
+    if not session.get("active"):
+        raise RuntimeError("No Active Attendance Session")
+
+    click_started = time.perf_counter()
+    request = {"roll": roll, "pass_key": PASS_KEY}
+    status, data = api_request(port, "POST", "/api/mark", request)
+
+    if data.get("error") == "registration_required":
+        request.update(
+            name=f"Student {roll}",
+            student_class="B.Sc 1",
+            gmail=f"{roll.lower()}@example.com",
+            mobile="9999999999",
+        )
+        click_started = time.perf_counter()
+        status, data = api_request(port, "POST", "/api/mark", request)
+
+    finished = time.perf_counter()
+    return {
+        "roll": roll,
+        "outcome": data.get("result", "error"),
+        "flow_seconds": finished - started,
+        "click_seconds": finished - click_started,
+        "messages": [data["error"]] if "error" in data else [],
+    }
+
+
+def start_api_server(db_path):
+    import socket
+
+    import uvicorn
+
+    from attendance_api import AttendanceAPI
+    from attendance_core import EmailSettings
+
+    api = AttendanceAPI(db_path, EmailSettings(
+        SECRETS["EMAIL_ADDRESS"], SECRETS["EMAIL_PASSWORD"]
+    ))
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(
+        api, host="127.0.0.1", port=port, log_level="warning", backlog=4096
+    ))
+    threading.Thread(target=server.run, name="api-server", daemon=True).start()
+
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("API server did not start")
+        time.sleep(0.05)
+    return server, port
+
+
+def run_student(simulate, roll):
+    try:
+        return simulate(roll)
+    except Exception as exc:  # a crashed run is a data point, not a harness failure
+        return {
+            "roll": roll,
+            "outcome": "exception",
+            "flow_seconds": None,
+            "click_seconds": None,
+            "messages": [f"{type(exc).__name__}: {exc}"],
+        }
+
+
+# ============================================================
+# DATABASE SEEDING
+# ============================================================
+
+def seed_database(db_path, students, capacity, registered_fraction):
+    from attendance_core import migrate_database
+
+    migrate_database(db_path)
+
+    rolls = [f"BENCH{i:04d}" for i in range(students)]
+    registered = rolls[:int(students * registered_fraction)]
+
+    seed_conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    seed_conn.execute("BEGIN IMMEDIATE")
+    seed_conn.execute(
+        "INSERT INTO sessions (token, subject, expiry, capacity) VALUES (?, ?, ?, ?)",
+        (
+            PASS_KEY,
+            SUBJECT,
+            (now_ist() + timedelta(minutes=30)).strftime("%Y-%m-%d %H:%M:%S"),
+            capacity,
+        )
+    )
+    seed_conn.executemany(
+        "INSERT INTO students VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (roll, f"Student {roll}", "B.Sc 1", f"{roll.lower()}@example.com", "9999999999", SUBJECT)
+            for roll in registered
+        ]
+    )
+    seed_conn.execute("COMMIT")
+    seed_conn.close()
+
+    return rolls
+
+
+# ============================================================
+# REPORTING
+# ============================================================
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def wait_for_outbox(db_path, timeout):
+    deadline = time.monotonic() + timeout
+    check_conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        while time.monotonic() < deadline:
+            pending = check_conn.execute(
+                "SELECT COUNT(*) FROM email_outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+            if not pending:
+                break
+            time.sleep(0.2)
+        return dict(check_conn.execute(
+            "SELECT status, COUNT(*) FROM email_outbox GROUP BY status"
+        ).fetchall())
+    finally:
+        check_conn.close()
+
+
+def summarize(results, wall_seconds, db_path, outbox):
+    flows = [r["flow_seconds"] for r in results if r["flow_seconds"] is not None]
+    clicks = [r["click_seconds"] for r in results if r["click_seconds"] is not None]
+    messages = [m for r in results for m in r["messages"]]
+
+    def latency(values):
+        return {
+            "p50_ms": round(percentile(values, 50) * 1000, 1) if values else None,
+            "p95_ms": round(percentile(values, 95) * 1000, 1) if values else None,
+            "p99_ms": round(percentile(values, 99) * 1000, 1) if values else None,
+            "mean_ms": round(statistics.fmean(values) * 1000, 1) if values else None,
+        }
+
+    return {
+        "students": len(results),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_second": round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        "flow_latency": latency(flows),
+        "click_latency": latency(clicks),
+        "outcomes": dict(Counter(r["outcome"] for r in results)),
+        "lock_timeouts": sum(
+            1 for m in messages if "database is locked" in m or "TimeoutError" in m
+        ),
+        "emails": {
+            "outbox": outbox,
+            "delivered": len(InMemorySMTP.delivered),
+            "smtp_connections": InMemorySMTP.connections,
+        },
+        "db_bytes": file_size(db_path),
+        "wal_bytes": file_size(db_path + "-wal"),
+    }
+
+
+def print_report(report):
+    print(f"Students:        {report['students']}")
+    print(f"Wall time:       {report['wall_seconds']} s")
+    print(f"Throughput:      {report['throughput_per_second']} marks/s")
+    for name in ("flow_latency", "click_latency"):
+        lat = report[name]
+        print(
+            f"{name:<16} p50 {lat['p50_ms']} ms | p95 {lat['p95_ms']} ms | "
+            f"p99 {lat['p99_ms']} ms | mean {lat['mean_ms']} ms"
+        )
+    print(f"Outcomes:        {report['outcomes']}")
+    print(f"Lock timeouts:   {report['lock_timeouts']}")
+    print(f"Emails:          {report['emails']}")
+    print(f"DB size:         {report['db_bytes']} bytes")
+    print(f"WAL size:        {report['wal_bytes']} bytes")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=("service", "api", "app"), default="service")
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50,
+                        help="simultaneous students (service and api modes)")
+    parser.add_argument("--capacity", type=int, default=None,
+                        help="session capacity (default: number of students)")
+    parser.add_argument("--registered-fraction", type=float, default=0.8,
+                        help="share of students already in the roster")
+    parser.add_argument("--timeout", type=float, default=60,
+                        help="per-run AppTest timeout in seconds")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="attendance-bench-")
+    db_path = os.path.join(workdir, "attendance.db")
+    os.environ["ATTENDANCE_DB"] = db_path
+
+    smtplib.SMTP = InMemorySMTP
+    smtplib.SMTP_SSL = InMemorySMTP
+
+    rolls = seed_database(
+        db_path,
+        args.students,
+        args.capacity or args.students,
+        args.registered_fraction
+    )
+
+    if args.mode == "service":
+        from attendance_core import AttendanceService, EmailSettings
+
+        service = AttendanceService(db_path, EmailSettings(
+            SECRETS["EMAIL_ADDRESS"], SECRETS["EMAIL_PASSWORD"]
+        ))
+
+        def simulate(roll):
+            return simulate_service_student(service, roll)
+
+        workers = args.concurrency
+    elif args.mode == "api":
+        server, port = start_api_server(db_path)
+
+        def simulate(roll):
+            return simulate_api_student(port, roll)
+
+        workers = args.concurrency
+    else:
+        def simulate(roll):
+            return simulate_student(roll, args.timeout)
+
+        workers = 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda roll: run_student(simulate, roll), rolls))
+    wall_seconds = time.perf_counter() - started
+
+    if args.mode == "api":
+        server.should_exit = True
+
+    outbox = wait_for_outbox(db_path, timeout=30)
+    report = summarize(results, wall_seconds, db_path, outbox)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    return 0 if report["outcomes"].get("exception", 0) == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Request validation of the marking API."""
+
+import asyncio
+import json
+
+import pytest
+
+from attendance_api import AttendanceAPI, HTTPError
+from attendance_core import MARK_OK, EmailSettings
+
+SUBJECT = "Waves and Optics (PHYS202TH)"
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    monkeypatch.delenv("QR_SIGNING_SECRET", raising=False)
+    api = AttendanceAPI(str(tmp_path / "attendance.db"), EmailSettings())
+    api.pass_key = api.service.create_session(SUBJECT, 300).token
+    return api
+
+
+def mark(api, **payload):
+    payload.setdefault("pass_key", api.pass_key)
+    return asyncio.run(api.mark(json.dumps(payload).encode()))
+
+
+def mark_error(api, **payload):
+    with pytest.raises(HTTPError) as error:
+        mark(api, **payload)
+    return error.value.status, error.value.payload
+
+
+@pytest.mark.parametrize("roll", [None, 123, ["R1"], "  "])
+def test_missing_or_non_string_roll(api, roll):
+    assert mark_error(api, roll=roll) == (400, {"error": "roll_required"})
+
+
+def test_null_and_non_string_registration_fields_are_missing(api):
+    status, payload = mark_error(
+        api, roll="r1", name=None, student_class="B.Sc 2", gmail=["a@gmail.com"], mobile=9876543210
+    )
+
+    assert status == 422
+    assert payload == {"error": "registration_required", "fields": ["name", "gmail", "mobile"]}
+    assert api.service.find_student("R1", SUBJECT) is None
+
+
+def test_null_pass_key_is_rejected(api):
+    assert mark_error(api, roll="R1", pass_key=None)[0] == 403
+
+
+def test_first_time_registration_marks(api):
+    status, payload = mark(
+        api, roll=" r1 ", name="Asha", student_class="B.Sc 2",
+        gmail="asha@gmail.com", mobile="9876543210"
+    )
+
+    assert (status, payload["result"]) == (200, MARK_OK)
+    assert api.service.find_student("R1", SUBJECT).name == "Asha"
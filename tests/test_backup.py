@@ -0,0 +1,140 @@
+"""Full / delta backups, restore and verification."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from attendance_backup import backup_database, copy_database, restore_backup, verify_backup
+from attendance_core import migrate_database, open_connection
+
+
+def add_sessions(db_path, first, count, subject="Waves and Optics (PHYS202TH)"):
+    conn = open_connection(db_path)
+    try:
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO sessions (token, subject, expiry, capacity) VALUES (?, ?, ?, ?)",
+            [
+                (f"T{number:06d}", subject, f"2026-01-{1 + number % 28:02d} 10:00:00", 100)
+                for number in range(first, first + count)
+            ]
+        )
+        conn.executemany(
+            """INSERT INTO attendance (roll, name, subject, timestamp, token, status)
+               VALUES (?, ?, ?, ?, ?, 'Present')""",
+            [
+                (f"R{number:06d}", "Student", subject,
+                 f"2026-01-{1 + number % 28:02d} 09:00:00", f"T{number:06d}")
+                for number in range(first, first + count)
+            ]
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def dump(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return list(conn.iterdump())
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "attendance.db")
+    migrate_database(path)
+    add_sessions(path, 0, 2000)
+    return path
+
+
+def test_delta_chain_restores_each_state(db_path, tmp_path):
+    backup_dir = str(tmp_path / "backups")
+
+    full = backup_database(db_path, backup_dir)
+    states = [(full, dump(db_path))]
+
+    add_sessions(db_path, 2000, 300)
+    states.append((backup_database(db_path, backup_dir), dump(db_path)))
+
+    # Shrink the file so the delta also has to truncate
+    conn = open_connection(db_path)
+    conn.execute("DELETE FROM attendance WHERE roll < 'R001500'")
+    conn.execute("VACUUM")
+    conn.close()
+    states.append((backup_database(db_path, backup_dir), dump(db_path)))
+
+    assert [result.kind for result, _ in states] == ["full", "delta", "delta"]
+    assert states[1][0].changed_pages < states[1][0].page_count
+    assert states[2][0].page_count < states[1][0].page_count
+
+    for number, (result, expected) in enumerate(states):
+        restored = str(tmp_path / f"restored{number}.db")
+        restore_backup(result.manifest_path, restored)
+        assert dump(restored) == expected
+        assert verify_backup(result.manifest_path).ok
+
+
+def test_backup_during_writes_is_consistent(db_path, tmp_path):
+    backup_dir = str(tmp_path / "backups")
+    backup_database(db_path, backup_dir)
+    stop = threading.Event()
+
+    def keep_writing():
+        number = 10_000
+        while not stop.is_set():
+            add_sessions(db_path, number, 5)
+            number += 5
+
+    writer = threading.Thread(target=keep_writing)
+    writer.start()
+    try:
+        result = backup_database(db_path, backup_dir, pages_per_step=8)
+    finally:
+        stop.set()
+        writer.join()
+
+    check = verify_backup(result.manifest_path)
+    assert check.ok, check.integrity
+
+    restored = str(tmp_path / "restored.db")
+    restore_backup(result.manifest_path, restored)
+    conn = sqlite3.connect(restored)
+    sessions, attendance = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM sessions), (SELECT COUNT(*) FROM attendance)"
+    ).fetchone()
+    conn.close()
+    assert sessions == attendance >= 2000
+
+
+def test_tampered_delta_fails_verification(db_path, tmp_path):
+    backup_dir = str(tmp_path / "backups")
+    backup_database(db_path, backup_dir)
+    add_sessions(db_path, 2000, 300)
+    delta = backup_database(db_path, backup_dir)
+
+    with open(delta.manifest_path, encoding="utf-8") as manifest_file:
+        data_path = os.path.join(backup_dir, json.load(manifest_file)["data"])
+    with open(data_path, "r+b") as data_file:
+        data_file.seek(-100, os.SEEK_END)
+        data_file.write(b"\xff" * 16)
+
+    check = verify_backup(delta.manifest_path)
+    assert not check.ok
+    assert "does not match" in check.integrity
+
+    with pytest.raises(ValueError):
+        restore_backup(delta.manifest_path, str(tmp_path / "restored.db"))
+
+
+def test_copy_pauses_between_steps(db_path, tmp_path):
+    started = time.perf_counter()
+    pages = copy_database(db_path, str(tmp_path / "copy.db"), pages_per_step=20, sleep=0.02)
+    steps = -(-pages // 20)
+
+    assert time.perf_counter() - started >= (steps - 1) * 0.02
@@ -0,0 +1,148 @@
+"""Email outbox against a local SMTP stand-in (aiosmtpd)."""
+
+import socket
+import time
+
+import pytest
+
+controller = pytest.importorskip("aiosmtpd.controller")
+
+import attendance_core
+from attendance_core import (
+    EMAIL_MAX_ATTEMPTS,
+    AttendanceService,
+    ConnectionManager,
+    EmailOutbox,
+    EmailSettings,
+)
+
+
+class RecordingHandler:
+    """Accepts every recipient except those in ``refused``."""
+
+    def __init__(self):
+        self.delivered = []
+        self.refused = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return "550 mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.delivered.extend(envelope.rcpt_tos)
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    handler = RecordingHandler()
+    server = controller.Controller(handler, hostname="127.0.0.1", port=port)
+    server.start()
+    yield handler, EmailSettings("faculty@example.com", "secret", "127.0.0.1", port, use_ssl=False)
+    server.stop()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "attendance.db")
+
+
+def queue_email(db, outbox, to_email):
+    db.write(lambda write_conn: outbox.enqueue(
+        write_conn, to_email, "Attendance Confirmed", "Your attendance is marked."
+    ))
+
+
+def outbox_rows(db):
+    return db.reader().execute(
+        "SELECT to_email, status, attempts FROM email_outbox ORDER BY id"
+    ).fetchall()
+
+
+def test_batch_is_sent_over_one_connection(smtp, db_path):
+    handler, settings = smtp
+    db = ConnectionManager(db_path)
+    outbox = EmailOutbox(db, settings, start_sender=False)
+
+    for number in range(3):
+        queue_email(db, outbox, f"student{number}@gmail.com")
+
+    assert outbox._send_batch() is False
+    assert handler.delivered == [f"student{number}@gmail.com" for number in range(3)]
+    assert outbox.stats(db.reader())["sent"] == 3
+    assert [row[2] for row in outbox_rows(db)] == [1, 1, 1]
+
+
+def test_refused_email_is_retried_then_failed(smtp, db_path):
+    handler, settings = smtp
+    handler.refused.add("bounce@gmail.com")
+    db = ConnectionManager(db_path)
+    outbox = EmailOutbox(db, settings, start_sender=False)
+
+    queue_email(db, outbox, "bounce@gmail.com")
+    queue_email(db, outbox, "ok@gmail.com")
+    outbox._send_batch()
+
+    assert outbox_rows(db) == [("bounce@gmail.com", "pending", 1), ("ok@gmail.com", "sent", 1)]
+    retry_at, last_error = db.reader().execute(
+        "SELECT next_attempt_at, last_error FROM email_outbox WHERE to_email = 'bounce@gmail.com'"
+    ).fetchone()
+    assert retry_at > time.time()
+    assert "550" in last_error
+
+    # Backoff pushed the retry out; nothing is claimed before it is due
+    outbox._send_batch()
+    assert outbox_rows(db)[0] == ("bounce@gmail.com", "pending", 1)
+
+    for _ in range(EMAIL_MAX_ATTEMPTS - 1):
+        db.write(lambda write_conn: write_conn.execute(
+            "UPDATE email_outbox SET next_attempt_at = 0 WHERE status = 'pending'"
+        ))
+        outbox._send_batch()
+
+    assert outbox_rows(db)[0] == ("bounce@gmail.com", "failed", EMAIL_MAX_ATTEMPTS)
+    assert handler.delivered == ["ok@gmail.com"]
+
+
+def test_sender_thread_delivers_queued_email(smtp, db_path):
+    handler, settings = smtp
+    service = AttendanceService(db_path, settings, archive_path=None)
+
+    queue_email(service.db, service.outbox, "student@gmail.com")
+
+    deadline = time.monotonic() + 10
+    while service.outbox.stats(service.db.reader())["sent"] < 1:
+        assert time.monotonic() < deadline, "email was not sent"
+        time.sleep(0.05)
+    assert handler.delivered == ["student@gmail.com"]
+
+
+def test_claimed_rows_are_not_claimed_again(db_path):
+    first = ConnectionManager(db_path)
+    second = ConnectionManager(db_path)
+    outbox = EmailOutbox(first, EmailSettings(), start_sender=False)
+
+    queue_email(first, outbox, "student@gmail.com")
+
+    assert len(first.write(EmailOutbox._claim_batch)) == 1
+    assert second.write(EmailOutbox._claim_batch) == []
+
+
+def test_services_without_credentials_leave_the_outbox_alone(monkeypatch, db_path):
+    monkeypatch.setattr(attendance_core, "EMAIL_POLL_SECONDS", 0.05)
+    app = AttendanceService(db_path, archive_path=None)
+    queue_email(app.db, app.outbox, "student@gmail.com")
+
+    export = AttendanceService(db_path, archive_path=None, read_only=True)
+    api = AttendanceService(db_path, EmailSettings(), archive_path=None)
+    time.sleep(0.3)
+
+    assert export.db.writer is None
+    assert export.outbox._thread is None and api.outbox._thread is None
+    assert outbox_rows(app.db) == [("student@gmail.com", "pending", 0)]
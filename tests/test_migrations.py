@@ -0,0 +1,63 @@
+"""Schema migrations on legacy databases."""
+
+import logging
+import sqlite3
+
+from attendance_core import SCHEMA_MIGRATIONS, SCHEMA_VERSION, migrate_database
+
+
+def legacy_database(path, version):
+    conn = sqlite3.connect(path, isolation_level=None)
+    for _, migration in SCHEMA_MIGRATIONS[:version]:
+        migration(conn)
+    conn.execute(f"PRAGMA user_version = {version}")
+    return conn
+
+
+def test_same_day_duplicates_are_kept_aside(tmp_path, caplog):
+    path = str(tmp_path / "attendance.db")
+    conn = legacy_database(path, 5)
+    # Three sessions on one day, as happened before the unique daily index
+    conn.executemany(
+        "INSERT INTO sessions (token, subject, expiry, capacity) "
+        "VALUES (?, 'Optics', '2026-01-05 10:00:00', 100)",
+        [("T1",), ("T2",), ("T3",)]
+    )
+    conn.executemany(
+        "INSERT INTO attendance (roll, name, subject, timestamp, token, status) "
+        "VALUES (?, ?, 'Optics', ?, ?, ?)",
+        [
+            ("R1", "Asha", "2026-01-05 09:00:00", "T1", "Present"),
+            ("R1", "Asha", "2026-01-05 09:05:00", "T2", "Absent"),
+            ("R1", "Asha", "2026-01-05 09:10:00", "T3", "Present"),
+            ("R2", "Ravi", "2026-01-05 09:00:00", "T1", "Present"),
+        ]
+    )
+    conn.close()
+
+    with caplog.at_level(logging.WARNING, logger="attendance_core"):
+        assert migrate_database(path) == SCHEMA_VERSION
+    assert "Moved 2 same-day duplicate attendance rows" in caplog.text
+
+    conn = sqlite3.connect(path)
+    assert conn.execute(
+        "SELECT roll, timestamp FROM attendance ORDER BY roll"
+    ).fetchall() == [("R1", "2026-01-05 09:00:00"), ("R2", "2026-01-05 09:00:00")]
+    assert conn.execute(
+        "SELECT roll, timestamp, status FROM attendance_duplicates ORDER BY timestamp"
+    ).fetchall() == [
+        ("R1", "2026-01-05 09:05:00", "Absent"),
+        ("R1", "2026-01-05 09:10:00", "Present"),
+    ]
+    conn.close()
+
+
+def test_clean_database_gets_no_side_table(tmp_path):
+    path = str(tmp_path / "attendance.db")
+    migrate_database(path)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name = 'attendance_duplicates'"
+    ).fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,93 @@
+"""Moving closed terms into the archive database."""
+
+import sqlite3
+from datetime import date
+
+import pytest
+
+from attendance_core import migrate_database, open_connection
+from attendance_retention import archive_closed_terms
+
+CUTOFF = date(2026, 1, 1)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    db_path = str(tmp_path / "attendance.db")
+    archive_path = str(tmp_path / "attendance_archive.db")
+    migrate_database(db_path)
+
+    conn = open_connection(db_path)
+    conn.executemany(
+        "INSERT INTO sessions (token, subject, expiry, capacity) VALUES (?, 'Optics', ?, 100)",
+        [("OLD1", "2025-12-01 10:00:00"), ("OLD2", "2025-12-02 10:00:00"),
+         ("NEW1", "2026-01-05 10:00:00")]
+    )
+    conn.executemany(
+        """INSERT INTO attendance (roll, name, subject, timestamp, token, status)
+           VALUES (?, 'Student', 'Optics', ?, ?, 'Present')""",
+        [
+            (f"R{number}", timestamp, token)
+            for number in range(1, 6)
+            for timestamp, token in (
+                ("2025-12-01 09:00:00", "OLD1"),
+                ("2025-12-02 09:00:00", "OLD2"),
+                ("2026-01-05 09:00:00", "NEW1"),
+            )
+        ]
+    )
+    conn.close()
+    return db_path, archive_path
+
+
+def run(paths):
+    messages = []
+    result = archive_closed_terms(
+        *paths, cutoff=CUTOFF, backup_dir=None, batch_rows=3, log=messages.append
+    )
+    return result, messages
+
+
+def test_conflicting_rows_are_skipped_and_reported(paths):
+    db_path, archive_path = paths
+    run(paths)   # creates the archive schema and moves everything
+
+    # A live row the archive already holds with another token
+    conn = open_connection(db_path)
+    conn.execute(
+        "INSERT INTO sessions (token, subject, expiry, capacity) "
+        "VALUES ('OLD3', 'Optics', '2025-12-01 11:00:00', 100)"
+    )
+    conflicting = conn.execute(
+        """INSERT INTO attendance (roll, name, subject, timestamp, token, status)
+           VALUES ('R1', 'Student', 'Optics', '2025-12-01 11:00:00', 'OLD3', 'Present')"""
+    ).lastrowid
+    conn.execute(
+        """INSERT INTO attendance (roll, name, subject, timestamp, token, status)
+           VALUES ('R9', 'Student', 'Optics', '2025-12-01 11:00:00', 'OLD3', 'Present')"""
+    )
+    conn.close()
+
+    for _ in range(2):
+        result, messages = run(paths)
+
+        assert result.conflicts == {"attendance": (conflicting,)}
+        assert any("Kept 1 attendance rows live" in message for message in messages)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute(
+        "SELECT rowid FROM attendance WHERE day < ?", (CUTOFF.isoformat(),)
+    ).fetchall() == [(conflicting,)]
+    assert conn.execute("SELECT token FROM sessions").fetchall() == [("NEW1",)]
+    conn.close()
+
+    conn = sqlite3.connect(archive_path)
+    assert conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0] == 11
+    assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 3
+    conn.close()
+
+
+def test_clean_run_moves_closed_terms(paths):
+    result, _ = run(paths)
+
+    assert (result.attendance_rows, result.session_rows, result.conflicts) == (10, 2, {})